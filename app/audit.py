@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import insert
+
+from app.config import settings
+from app.db import AsyncSessionLocal
+from app.models import AuditLog
+
+log = logging.getLogger(__name__)
+
+
+class AuditBuffer:
+    # سجل تدقيق للمسارات الساخنة: يُجمع في الذاكرة ويُكتب دفعة واحدة كل N صف أو T مللي ثانية
+    def __init__(self, max_rows: int, interval_ms: int):
+        self.max_rows = max(1, max_rows)
+        self.interval = max(interval_ms, 10) / 1000
+        self._rows: List[Dict[str, Any]] = []
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.written = 0
+        self.failed = 0
+        self.flushes = 0
+
+    def add(self, actor: int | None, action: str, entity: str, entity_id: str | None, detail: str | None) -> None:
+        self._rows.append({
+            "actor_user_id": actor,
+            "action": action,
+            "entity": entity,
+            "entity_id": entity_id,
+            "detail": detail,
+        })
+        if len(self._rows) >= self.max_rows:
+            self._wakeup.set()
+
+    async def flush(self) -> None:
+        rows, self._rows = self._rows, []
+        if not rows:
+            return
+        try:
+            async with AsyncSessionLocal() as session:
+                await session.execute(insert(AuditLog), rows)
+                await session.commit()
+            self.written += len(rows)
+            self.flushes += 1
+        except Exception:
+            self.failed += len(rows)
+            log.exception("Failed to write %s audit rows", len(rows))
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": len(self._rows),
+            "written": self.written,
+            "failed": self.failed,
+            "flushes": self.flushes,
+        }
+
+
+audit_buffer = AuditBuffer(settings.audit_flush_rows, settings.audit_flush_ms)
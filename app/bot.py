@@ -1,5 +1,19 @@
 from aiogram import Bot, Dispatcher
+from aiogram.client.default import DefaultBotProperties
+from aiogram.fsm.storage.memory import MemoryStorage
+
 from app.config import settings
+from app.fsm_storage import DbStorage
+from app.outbound import outbound_scheduler
+
+bot = Bot(token=settings.bot_token, default=DefaultBotProperties(parse_mode="HTML"))
+bot.session.middleware(outbound_scheduler)
+
+
+def _make_storage():
+    if settings.fsm_storage == "memory":
+        return MemoryStorage()
+    return DbStorage()
+
 
-bot = Bot(token=settings.BOT_TOKEN)
-dp = Dispatcher()
+dp = Dispatcher(storage=_make_storage())
@@ -0,0 +1,196 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+from sqlalchemy import delete, exists, func, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.db import AsyncSessionLocal
+from app.models import BroadcastCampaign, JobShard, User
+from app.outbound import background
+from app.ratelimit import TokenBucket
+from app.shards import Lease, run_shards
+
+log = logging.getLogger(__name__)
+
+ACTIVE = ("pending", "running")
+
+# أقل من الحد العام للبوت حتى يبقى هامش للردود التفاعلية؛ outbound_scheduler يقدّمها على الإذاعة
+_pace = TokenBucket(settings.broadcast_rate, capacity=1)
+
+
+def broadcast_job(campaign_id: int) -> str:
+    return f"broadcast:{campaign_id}"
+
+
+def _recipients():
+    return (User.is_banned == False, User.suspended == False)
+
+
+async def create_campaign(session: AsyncSession, admin_id: int, text: str) -> BroadcastCampaign:
+    total = (await session.execute(select(func.count()).select_from(User).where(*_recipients()))).scalar_one()
+    campaign = BroadcastCampaign(created_by=admin_id, text=text, total=total)
+    session.add(campaign)
+    await session.flush()
+    return campaign
+
+
+async def _plan(campaign_id: int) -> None:
+    # جزء واحد لكل حملة: مرسل واحد فقط في كل لحظة، فالسرعة لا تتضاعف مع عدد العمال
+    async with AsyncSessionLocal() as session:
+        await session.execute(
+            insert(JobShard)
+            .values(job=broadcast_job(campaign_id), shard=0, shard_count=1, generation=1,
+                    range_start=0, range_end=None, cursor=0)
+            .on_conflict_do_nothing()
+        )
+        await session.commit()
+
+
+async def cancel_campaign(session: AsyncSession, campaign_id: int) -> bool:
+    res = await session.execute(
+        update(BroadcastCampaign)
+        .where(BroadcastCampaign.id == campaign_id, BroadcastCampaign.status.in_(ACTIVE))
+        .values(status="cancelled", finished_at=func.now())
+    )
+    return bool(res.rowcount)
+
+
+def campaign_eta(c: BroadcastCampaign) -> Optional[int]:
+    if c.status not in ACTIVE:
+        return None
+    processed = c.sent + c.failed + c.blocked
+    remaining = max(c.total - processed, 0)
+    rate = settings.broadcast_rate
+    if c.started_at and processed:
+        elapsed = (datetime.now(timezone.utc) - c.started_at).total_seconds()
+        if elapsed > 0:
+            rate = processed / elapsed
+    return int(remaining / max(rate, 0.001))
+
+
+async def _send(bot: Bot, chat_id: int, text: str) -> str:
+    # 429 يعيد المحاولة فيه outbound_scheduler
+    try:
+        await bot.send_message(chat_id, text)
+        return "sent"
+    except TelegramForbiddenError:
+        return "blocked"
+    except TelegramBadRequest as e:
+        log.warning("Broadcast to %s rejected: %s", chat_id, e)
+        return "failed"
+    except Exception:
+        log.exception("Broadcast to %s failed", chat_id)
+        return "failed"
+
+
+async def _deliver(bot: Bot, campaign_id: int, lease: Lease) -> None:
+    async with AsyncSessionLocal() as session:
+        text = (await session.execute(
+            update(BroadcastCampaign)
+            .where(BroadcastCampaign.id == campaign_id, BroadcastCampaign.status.in_(ACTIVE))
+            .values(status="running", started_at=func.coalesce(BroadcastCampaign.started_at, func.now()))
+            .returning(BroadcastCampaign.text)
+        )).scalar_one_or_none()
+        await session.commit()
+    if text is None:
+        return
+
+    sem = asyncio.Semaphore(max(settings.broadcast_concurrency, 1))
+
+    async def one(user_id: int) -> str:
+        try:
+            return await _send(bot, user_id, text)
+        finally:
+            sem.release()
+
+    # دفعات keyset قصيرة: لا تحميل للمستلمين في الذاكرة ولا معاملة مفتوحة طوال الإرسال.
+    # بعد انهيار يكمل عامل آخر من آخر نقطة حفظ، فأقصى تكرار دفعة واحدة
+    while not lease.lost:
+        async with AsyncSessionLocal() as session:
+            ids = (await session.execute(
+                select(User.id)
+                .where(*_recipients(), User.id > lease.claim.cursor)
+                .order_by(User.id.asc())
+                .limit(settings.broadcast_batch_size)
+            )).scalars().all()
+        if not ids:
+            async with AsyncSessionLocal() as session:
+                await session.execute(
+                    update(BroadcastCampaign)
+                    .where(BroadcastCampaign.id == campaign_id, BroadcastCampaign.status == "running")
+                    .values(status="done", finished_at=func.now())
+                )
+                await session.commit()
+            return
+
+        tasks: List[asyncio.Task] = []
+        for user_id in ids:
+            await sem.acquire()
+            await _pace.acquire()
+            tasks.append(asyncio.create_task(one(user_id)))
+        results = await asyncio.gather(*tasks)
+
+        async with AsyncSessionLocal() as session:
+            status = (await session.execute(
+                update(BroadcastCampaign)
+                .where(BroadcastCampaign.id == campaign_id)
+                .values(
+                    sent=BroadcastCampaign.sent + results.count("sent"),
+                    failed=BroadcastCampaign.failed + results.count("failed"),
+                    blocked=BroadcastCampaign.blocked + results.count("blocked"),
+                )
+                .returning(BroadcastCampaign.status)
+            )).scalar_one_or_none()
+            if not await lease.checkpoint(session, ids[-1]):
+                await session.rollback()
+                return
+            await session.commit()
+        if status != "running":
+            return
+
+
+async def _finish(campaign_id: int) -> None:
+    job = broadcast_job(campaign_id)
+    async with AsyncSessionLocal() as session:
+        # الجزء تجاوز عدد المحاولات: الحملة لن تكتمل
+        await session.execute(
+            update(BroadcastCampaign)
+            .where(
+                BroadcastCampaign.id == campaign_id,
+                BroadcastCampaign.status.in_(ACTIVE),
+                exists().where(JobShard.job == job, JobShard.done == False, JobShard.attempts >= settings.shard_max_attempts),
+            )
+            .values(status="failed", finished_at=func.now())
+        )
+        await session.execute(
+            delete(JobShard).where(
+                JobShard.job == job,
+                ~exists().where(BroadcastCampaign.id == campaign_id, BroadcastCampaign.status.in_(ACTIVE)),
+            )
+        )
+        await session.commit()
+
+
+@background
+async def run_broadcasts(bot: Bot) -> None:
+    # الأقدم أولًا وواحدة في كل مرة؛ كل العمال يحاولون والعقد يضمن أن واحدًا فقط يرسل
+    async with AsyncSessionLocal() as session:
+        campaign_id = (await session.execute(
+            select(BroadcastCampaign.id)
+            .where(BroadcastCampaign.status.in_(ACTIVE))
+            .order_by(BroadcastCampaign.id.asc())
+            .limit(1)
+        )).scalar_one_or_none()
+    if campaign_id is None:
+        return
+    await _plan(campaign_id)
+    await run_shards(broadcast_job(campaign_id), lambda lease: _deliver(bot, campaign_id, lease))
+    await _finish(campaign_id)
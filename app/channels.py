@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from aiogram import Bot
+
+from app.config import settings
+
+log = logging.getLogger(__name__)
+
+
+@dataclass
+class MandatoryChannel:
+    ref: str
+    username: Optional[str]
+    url: Optional[str]
+    chat_id: Optional[int] = None
+
+
+def parse_channel_ref(ref: str) -> MandatoryChannel:
+    # يقبل @name أو رابط t.me/name أو معرّفًا رقميًا -100...
+    if ref.startswith("@"):
+        username = ref[1:]
+        return MandatoryChannel(ref=ref, username=username, url=f"https://t.me/{username}")
+    if "t.me/" in ref:
+        path = ref.split("t.me/")[-1].split("?")[0].strip("/")
+        url = ref if ref.startswith("http") else f"https://{ref}"
+        # روابط الدعوة (+xxx أو joinchat/xxx) لا تحمل يوزرًا
+        username = None if path.startswith(("+", "joinchat")) else path
+        return MandatoryChannel(ref=ref, username=username, url=url)
+    try:
+        return MandatoryChannel(ref=ref, username=None, url=None, chat_id=int(ref))
+    except ValueError:
+        return MandatoryChannel(ref=ref, username=None, url=None)
+
+
+class ChannelRegistry:
+    # تُحل القنوات الإلزامية مرة عند الإقلاع ثم دوريًا أو بأمر إداري، وكل مسارات البوابة تقرأ منها
+    def __init__(self, refs: List[str]):
+        self.channels = [parse_channel_ref(r) for r in refs]
+        self.refreshed_at: Optional[float] = None
+        self.failures = 0
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.channels)
+
+    @property
+    def fully_resolved(self) -> bool:
+        return all(ch.chat_id is not None for ch in self.channels)
+
+    def chat_ids(self) -> List[int]:
+        return [ch.chat_id for ch in self.channels if ch.chat_id is not None]
+
+    def is_mandatory(self, chat_id: int, username: Optional[str] = None) -> bool:
+        for ch in self.channels:
+            if ch.chat_id == chat_id:
+                return True
+            if username and ch.username and ch.username.lower() == username.lower():
+                return True
+        return False
+
+    def gate_url(self) -> Optional[str]:
+        for ch in self.channels:
+            if ch.url:
+                return ch.url
+        return None
+
+    async def refresh(self, bot: Bot, only_missing: bool = False) -> int:
+        # عند الفشل نبقي المعرّف السابق، فتغيير يوزر القناة لا يكسر البوابة
+        resolved = 0
+        for ch in self.channels:
+            if only_missing and ch.chat_id is not None:
+                continue
+            target: Any = f"@{ch.username}" if ch.username else ch.chat_id
+            if target is None:
+                continue
+            try:
+                chat = await bot.get_chat(target)
+            except Exception as e:
+                self.failures += 1
+                log.warning("Could not resolve mandatory channel %s: %s", ch.ref, e)
+                continue
+            ch.chat_id = chat.id
+            if chat.username:
+                ch.username = chat.username
+                ch.url = f"https://t.me/{chat.username}"
+            elif chat.invite_link and not ch.url:
+                ch.url = chat.invite_link
+            resolved += 1
+        self.refreshed_at = time.time()
+        return resolved
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "channels": [
+                {"ref": ch.ref, "chat_id": ch.chat_id, "username": ch.username, "url": ch.url}
+                for ch in self.channels
+            ],
+            "refreshed_at": int(self.refreshed_at) if self.refreshed_at else None,
+            "failures": self.failures,
+        }
+
+
+mandatory_channels = ChannelRegistry(settings.mandatory_channels_list)
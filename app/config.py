@@ -1,17 +1,121 @@
-from pydantic_settings import BaseSettings
+from __future__ import annotations
+
+from functools import cached_property
+
+from pydantic_settings import BaseSettings, SettingsConfigDict
+from pydantic import Field
+from typing import List
 
 
 class Settings(BaseSettings):
-    BOT_TOKEN: str
-    BASE_URL: str
-    WEBHOOK_SECRET: str
-    DATABASE_URL: str
+    model_config = SettingsConfigDict(env_file=".env", extra="ignore")
+
+    bot_token: str = Field(alias="BOT_TOKEN")
+    base_url: str = Field(alias="BASE_URL")
+    webhook_secret: str = Field(alias="WEBHOOK_SECRET")
+
+    database_url: str = Field(alias="DATABASE_URL")
+    db_pool_size: int = Field(default=10, alias="DB_POOL_SIZE")
+    db_max_overflow: int = Field(default=20, alias="DB_MAX_OVERFLOW")
+
+    leader_election_enabled: bool = Field(default=True, alias="LEADER_ELECTION_ENABLED")
+    leader_lock_id: int = Field(default=7101, alias="LEADER_LOCK_ID")
+    leader_check_seconds: float = Field(default=10, alias="LEADER_CHECK_SECONDS")
+    hmac_secret: str = Field(alias="HMAC_SECRET")
+
+    mandatory_channels: str = Field(default="", alias="MANDATORY_CHANNELS")
+    check_membership_every_hours: int = Field(default=6, alias="CHECK_MEMBERSHIP_EVERY_HOURS")
+    auto_draw_scan_seconds: int = Field(default=600, alias="AUTO_DRAW_SCAN_SECONDS")
+    mandatory_channels_refresh_minutes: int = Field(default=60, alias="MANDATORY_CHANNELS_REFRESH_MINUTES")
+
+    membership_cache_backend: str = Field(default="memory", alias="MEMBERSHIP_CACHE_BACKEND")
+    membership_cache_ttl_member: int = Field(default=300, alias="MEMBERSHIP_CACHE_TTL_MEMBER")
+    membership_cache_ttl_left: int = Field(default=15, alias="MEMBERSHIP_CACHE_TTL_LEFT")
+    membership_cache_size: int = Field(default=100_000, alias="MEMBERSHIP_CACHE_SIZE")
+    membership_reconcile_hours: int = Field(default=24, alias="MEMBERSHIP_RECONCILE_HOURS")
+    membership_reconcile_batch: int = Field(default=500, alias="MEMBERSHIP_RECONCILE_BATCH")
+    membership_check_rate: float = Field(default=20.0, alias="MEMBERSHIP_CHECK_RATE")
+    sweep_batch_size: int = Field(default=500, alias="SWEEP_BATCH_SIZE")
+    sweep_concurrency: int = Field(default=10, alias="SWEEP_CONCURRENCY")
+
+    shard_sweep_count: int = Field(default=8, alias="SHARD_SWEEP_COUNT")
+    shard_draw_count: int = Field(default=4, alias="SHARD_DRAW_COUNT")
+    shard_lease_seconds: int = Field(default=120, alias="SHARD_LEASE_SECONDS")
+    shard_poll_seconds: int = Field(default=15, alias="SHARD_POLL_SECONDS")
+    shard_max_attempts: int = Field(default=5, alias="SHARD_MAX_ATTEMPTS")
+    draw_concurrency: int = Field(default=10, alias="DRAW_CONCURRENCY")
+    draw_reserve: int = Field(default=5, alias="DRAW_RESERVE")
+    draw_batch_size: int = Field(default=200, alias="DRAW_BATCH_SIZE")
+
+    throttle_backend: str = Field(default="memory", alias="THROTTLE_BACKEND")
+    throttle_window_seconds: float = Field(default=2.0, alias="THROTTLE_WINDOW_SECONDS")
+    throttle_max_keys: int = Field(default=100_000, alias="THROTTLE_MAX_KEYS")
+    throttle_prefixes: str = Field(default="p:", alias="THROTTLE_PREFIXES")
+
+    channel_log_per_minute: float = Field(default=20, alias="CHANNEL_LOG_PER_MINUTE")
+    channel_log_digest_after: int = Field(default=3, alias="CHANNEL_LOG_DIGEST_AFTER")
+    channel_log_max_pending: int = Field(default=1000, alias="CHANNEL_LOG_MAX_PENDING")
+    channel_log_cache_seconds: int = Field(default=300, alias="CHANNEL_LOG_CACHE_SECONDS")
+
+    fsm_storage: str = Field(default="db", alias="FSM_STORAGE")
+    fsm_state_ttl_hours: int = Field(default=24, alias="FSM_STATE_TTL_HOURS")
+
+    user_cache_ttl_seconds: int = Field(default=60, alias="USER_CACHE_TTL_SECONDS")
+    user_cache_size: int = Field(default=100_000, alias="USER_CACHE_SIZE")
+    user_profile_flush_ms: int = Field(default=2000, alias="USER_PROFILE_FLUSH_MS")
+
+    notify_concurrency: int = Field(default=10, alias="NOTIFY_CONCURRENCY")
+    notify_max_attempts: int = Field(default=3, alias="NOTIFY_MAX_ATTEMPTS")
+    notify_stale_minutes: int = Field(default=10, alias="NOTIFY_STALE_MINUTES")
+
+    broadcast_rate: float = Field(default=20, alias="BROADCAST_RATE")
+    broadcast_batch_size: int = Field(default=200, alias="BROADCAST_BATCH_SIZE")
+    broadcast_concurrency: int = Field(default=20, alias="BROADCAST_CONCURRENCY")
+
+    export_page_size: int = Field(default=5000, alias="EXPORT_PAGE_SIZE")
+    export_concurrency: int = Field(default=2, alias="EXPORT_CONCURRENCY")
+
+    live_counter_interval_seconds: float = Field(default=5, alias="LIVE_COUNTER_INTERVAL_SECONDS")
+    stats_cache_seconds: int = Field(default=60, alias="STATS_CACHE_SECONDS")
+
+    bot_admin_cache_seconds: int = Field(default=60, alias="BOT_ADMIN_CACHE_SECONDS")
+    chat_resolve_cache_seconds: int = Field(default=3600, alias="CHAT_RESOLVE_CACHE_SECONDS")
+
+    outbound_global_rate: float = Field(default=30, alias="OUTBOUND_GLOBAL_RATE")
+    outbound_private_chat_rate: float = Field(default=1, alias="OUTBOUND_PRIVATE_CHAT_RATE")
+    outbound_group_per_minute: float = Field(default=20, alias="OUTBOUND_GROUP_PER_MINUTE")
+    outbound_method_rates: str = Field(default="", alias="OUTBOUND_METHOD_RATES")
+    outbound_max_retries: int = Field(default=3, alias="OUTBOUND_MAX_RETRIES")
+
+    audit_flush_rows: int = Field(default=200, alias="AUDIT_FLUSH_ROWS")
+    audit_flush_ms: int = Field(default=500, alias="AUDIT_FLUSH_MS")
+
+    admin_ids: str = Field(default="", alias="ADMIN_IDS")
+    support_bot: str = Field(default="@SupportBot", alias="SUPPORT_BOT")
+
+    webhook_queue_enabled: bool = Field(default=True, alias="WEBHOOK_QUEUE_ENABLED")
+    webhook_queue_size: int = Field(default=1000, alias="WEBHOOK_QUEUE_SIZE")
+    webhook_workers: int = Field(default=8, alias="WEBHOOK_WORKERS")
+    webhook_queue_overflow: str = Field(default="inline", alias="WEBHOOK_QUEUE_OVERFLOW")
+
+    # الإعدادات لا تتغير بعد الإقلاع، فتُقسَّم النصوص مرة واحدة
+    @cached_property
+    def mandatory_channels_list(self) -> List[str]:
+        return [x.strip() for x in self.mandatory_channels.split(",") if x.strip()]
 
-    ADMIN_IDS: str
-    SUPPORT_BOT: str = "@Rdhulman"
+    @cached_property
+    def throttle_prefixes_list(self) -> List[str]:
+        return [x.strip() for x in self.throttle_prefixes.split(",") if x.strip()]
 
-    class Config:
-        env_file = ".env"
+    @cached_property
+    def admin_ids_list(self) -> List[int]:
+        out: List[int] = []
+        for part in [x.strip() for x in self.admin_ids.split(",") if x.strip()]:
+            try:
+                out.append(int(part))
+            except ValueError:
+                continue
+        return out
 
 
 settings = Settings()
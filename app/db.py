@@ -1,22 +1,20 @@
-import asyncpg
-from app.config import settings
-
-
-class Database:
-    pool: asyncpg.Pool | None = None
+from __future__ import annotations
 
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.orm import DeclarativeBase
+from app.config import settings
 
-db = Database()
 
+class Base(DeclarativeBase):
+    pass
 
-async def connect_db():
-    db.pool = await asyncpg.create_pool(
-        dsn=settings.DATABASE_URL,
-        min_size=1,
-        max_size=5,
-    )
 
+engine = create_async_engine(
+    settings.database_url,
+    echo=False,
+    pool_pre_ping=True,
+    pool_size=settings.db_pool_size,
+    max_overflow=settings.db_max_overflow,
+)
 
-async def close_db():
-    if db.pool:
-        await db.pool.close()
+AsyncSessionLocal = async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import asyncio
+import random
+from typing import AsyncIterator, Dict, List, TypeVar
+
+from aiogram import Bot
+from sqlalchemy import select, func
+from sqlalchemy.engine import Row
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.models import Giveaway, Entry
+from app.membership import membership_cache, membership_limiter
+
+T = TypeVar("T")
+
+
+class LazyPermutation:
+    # Fisher–Yates كسول على 1..n: الذاكرة بحجم ما سُحب فقط وليس n
+    def __init__(self, n: int):
+        self.n = n
+        self._i = 0
+        self._swaps: Dict[int, int] = {}
+
+    def take(self, k: int) -> List[int]:
+        out: List[int] = []
+        while k > 0 and self._i < self.n:
+            j = random.randrange(self._i, self.n)
+            picked = self._swaps.get(j, j)
+            current = self._swaps.pop(self._i, self._i)
+            if j != self._i:
+                self._swaps[j] = current
+            out.append(picked + 1)
+            self._i += 1
+            k -= 1
+        return out
+
+
+async def iter_random_entries(session: AsyncSession, giveaway_id: int, batch_size: int = 0) -> AsyncIterator[Row]:
+    # ترتيب عشوائي منتظم للمشاركات غير المستبعدة بدون تحميلها كلها:
+    # نسحب أرقام seq_no عشوائيًا ونرفض ما هو مستبعد أو غير موجود
+    batch_size = batch_size or settings.draw_batch_size
+    max_seq = (await session.execute(
+        select(func.max(Entry.seq_no)).where(Entry.giveaway_id == giveaway_id)
+    )).scalar_one_or_none() or 0
+    perm = LazyPermutation(max_seq)
+
+    while True:
+        seqs = perm.take(batch_size)
+        if not seqs:
+            return
+        rows = (await session.execute(
+            select(Entry.id, Entry.user_id, Entry.username, Entry.seq_no).where(
+                Entry.giveaway_id == giveaway_id,
+                Entry.seq_no.in_(seqs),
+                Entry.excluded == False,
+            )
+        )).all()
+        by_seq: Dict[int, List[Row]] = {}
+        for r in rows:
+            by_seq.setdefault(r.seq_no, []).append(r)
+        for seq in seqs:
+            group = by_seq.get(seq)
+            if not group:
+                continue
+            random.shuffle(group)
+            for r in group:
+                yield r
+
+
+async def eligible_on_draw(bot: Bot, g: Giveaway, user_id: int) -> bool:
+    # شروط القنوات فقط (Premium لا يمكن إعادة التحقق منه رسميًا من API)
+    for cond in (g.cond_channel_1, g.cond_channel_2):
+        if cond:
+            try:
+                if not await membership_cache.is_member(bot, cond, user_id, limiter=membership_limiter):
+                    return False
+            except Exception:
+                if g.anti_fraud_recheck_on_draw:
+                    return False
+    if g.paid_comment_condition_enabled:
+        # لا ندّعي تحقق رسمي
+        return False
+    return True
+
+
+async def pick_winners(bot: Bot, g: Giveaway, candidates: AsyncIterator[T]) -> List[T]:
+    # candidates يجب أن تكون بترتيب عشوائي منتظم (iter_random_entries):
+    # أول k مؤهلين فيها = عينة منتظمة من المؤهلين، فنفحص بقدر ما نحتاج فقط
+    winners: List[T] = []
+    if not g.anti_fraud_recheck_on_draw:
+        async for e in candidates:
+            winners.append(e)
+            if len(winners) >= g.winners_count:
+                break
+        return winners
+    if g.paid_comment_condition_enabled:
+        return []
+
+    sem = asyncio.Semaphore(settings.draw_concurrency)
+
+    async def check(e) -> bool:
+        async with sem:
+            return await eligible_on_draw(bot, g, e.user_id)
+
+    async def flush(window: List[T]) -> None:
+        results = await asyncio.gather(*(check(e) for e in window))
+        for e, ok in zip(window, results):
+            if ok and len(winners) < g.winners_count:
+                winners.append(e)
+
+    window: List[T] = []
+    async for e in candidates:
+        window.append(e)
+        if len(window) >= (g.winners_count - len(winners)) + settings.draw_reserve:
+            await flush(window)
+            window = []
+            if len(winners) >= g.winners_count:
+                break
+    if window and len(winners) < g.winners_count:
+        await flush(window)
+    return winners
@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+import asyncio
+import csv
+import gzip
+import json
+import logging
+import os
+import tempfile
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Sequence, Tuple
+
+from aiogram import Bot
+from aiogram.types import FSInputFile
+from sqlalchemy import select
+
+from app.config import settings
+from app.db import AsyncSessionLocal
+from app.models import Entry, Winner
+from app.outbound import background
+
+log = logging.getLogger(__name__)
+
+FORMATS = ("csv", "jsonl")
+
+ENTRY_COLUMNS = ("seq_no", "user_id", "username", "excluded", "created_at")
+WINNER_COLUMNS = ("user_id", "username", "notify_status", "created_at")
+
+_sem = asyncio.Semaphore(max(settings.export_concurrency, 1))
+_running: Dict[Tuple[int, int], asyncio.Task] = {}
+
+# حد رفع الملفات في Bot API
+MAX_UPLOAD_BYTES = 50 * 1024 * 1024
+
+
+async def _pages(model, columns: Sequence[str], giveaway_id: int) -> AsyncIterator[List[Any]]:
+    # صفحة keyset لكل معاملة قصيرة، وداخلها مؤشر على الخادم (yield_per)؛
+    # لا معاملة تبقى مفتوحة طوال التصدير ولا يُحمَّل أكثر من صفحة في الذاكرة
+    last_id = 0
+    cols = [getattr(model, c) for c in columns]
+    while True:
+        async with AsyncSessionLocal() as session:
+            result = await session.stream(
+                select(model.id, *cols)
+                .where(model.giveaway_id == giveaway_id, model.id > last_id)
+                .order_by(model.id.asc())
+                .limit(settings.export_page_size)
+                .execution_options(yield_per=1000)
+            )
+            rows = [r async for r in result]
+        if not rows:
+            return
+        last_id = rows[-1].id
+        yield rows
+        if len(rows) < settings.export_page_size:
+            return
+
+
+def _value(v: Any) -> Any:
+    return v.isoformat() if isinstance(v, datetime) else v
+
+
+class _GzipWriter:
+    # يُضغط أثناء الكتابة إلى ملف مؤقت على القرص؛ الكتابة نفسها في thread حتى لا تحجز الحلقة
+    def __init__(self, fmt: str, columns: Sequence[str]):
+        self.fmt = fmt
+        self.columns = columns
+        fd, self.path = tempfile.mkstemp(suffix=f".{fmt}.gz")
+        os.close(fd)
+        self._gz = gzip.open(self.path, "wt", encoding="utf-8", newline="")
+        self._csv = csv.writer(self._gz) if fmt == "csv" else None
+        if self._csv:
+            self._csv.writerow(columns)
+        self.rows = 0
+
+    def write(self, rows: List[Any]) -> None:
+        for r in rows:
+            values = [_value(getattr(r, c)) for c in self.columns]
+            if self._csv:
+                self._csv.writerow(values)
+            else:
+                self._gz.write(json.dumps(dict(zip(self.columns, values)), ensure_ascii=False) + "\n")
+        self.rows += len(rows)
+
+    def close(self) -> None:
+        self._gz.close()
+
+    def discard(self) -> None:
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+async def write_export(model, columns: Sequence[str], giveaway_id: int, fmt: str) -> _GzipWriter:
+    writer = _GzipWriter(fmt, columns)
+    try:
+        async for rows in _pages(model, columns, giveaway_id):
+            await asyncio.to_thread(writer.write, rows)
+        await asyncio.to_thread(writer.close)
+    except BaseException:
+        writer.close()
+        writer.discard()
+        raise
+    return writer
+
+
+@background
+async def send_export(bot: Bot, chat_id: int, giveaway_id: int, fmt: str) -> None:
+    key = (chat_id, giveaway_id)
+    try:
+        async with _sem:
+            for name, model, columns in (("winners", Winner, WINNER_COLUMNS), ("entries", Entry, ENTRY_COLUMNS)):
+                writer = await write_export(model, columns, giveaway_id, fmt)
+                try:
+                    if os.path.getsize(writer.path) > MAX_UPLOAD_BYTES:
+                        await bot.send_message(chat_id, f"ملف {name} أكبر من حد تيليجرام (50MB).")
+                        continue
+                    await bot.send_document(
+                        chat_id,
+                        FSInputFile(writer.path, filename=f"giveaway_{giveaway_id}_{name}.{fmt}.gz"),
+                        caption=f"{name}: {writer.rows}",
+                    )
+                finally:
+                    writer.discard()
+    except Exception:
+        log.exception("Export of giveaway %s failed", giveaway_id)
+        try:
+            await bot.send_message(chat_id, "تعذر إكمال التصدير، حاول لاحقًا.")
+        except Exception:
+            pass
+    finally:
+        _running.pop(key, None)
+
+
+def request_export(bot: Bot, chat_id: int, giveaway_id: int, fmt: str) -> bool:
+    # لا يحجز عامل التحديثات: التصدير في مهمة منفصلة، وطلب مكرر لنفس السحب يُتجاهل حتى ينتهي الأول
+    key = (chat_id, giveaway_id)
+    if key in _running:
+        return False
+    _running[key] = asyncio.create_task(send_export(bot, chat_id, giveaway_id, fmt))
+    return True
@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import logging
+from datetime import timedelta
+from typing import Any, Dict, Mapping, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from sqlalchemy import cast, delete, func, select
+from sqlalchemy.dialects.postgresql import JSONB, insert
+
+from app.db import AsyncSessionLocal
+from app.models import FsmState
+
+log = logging.getLogger(__name__)
+
+
+class DbStorage(BaseStorage):
+    # الحالة في جدول fsm_states مشتركة بين كل العمال والخوادم.
+    # لا ذاكرة محلية: كل قراءة من الجدول وكل كتابة تُنفَّذ قبل أن يعود المعالج،
+    # فالتحديث التالي يرى أحدث حالة أيًا كان العامل الذي يستلمه
+    def __init__(self):
+        self.reads = 0
+        self.writes = 0
+
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+        return ":".join(str(x) for x in (
+            key.bot_id, key.chat_id, key.user_id, key.thread_id or "", key.business_connection_id or "", key.destiny,
+        ))
+
+    async def _write(self, k: str, **values: Any) -> None:
+        # upsert لعمود واحد فقط حتى لا تمحو set_state بيانات كتبها set_data والعكس؛
+        # السطر الذي صار فارغًا (بلا حالة ولا بيانات) يُحذف في نفس المعاملة
+        stmt = insert(FsmState).values(key=k, **{"state": None, "data": {}, **values})
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[FsmState.key],
+            set_={**{c: getattr(stmt.excluded, c) for c in values}, "updated_at": func.now()},
+        )
+        async with AsyncSessionLocal() as session:
+            await session.execute(stmt)
+            await session.execute(
+                delete(FsmState).where(
+                    FsmState.key == k, FsmState.state.is_(None), FsmState.data == cast({}, JSONB),
+                )
+            )
+            await session.commit()
+        self.writes += 1
+
+    async def _read(self, k: str):
+        self.reads += 1
+        async with AsyncSessionLocal() as session:
+            return (await session.execute(select(FsmState.state, FsmState.data).where(FsmState.key == k))).first()
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        await self._write(self._key(key), state=state.state if isinstance(state, State) else state)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        row = await self._read(self._key(key))
+        return row.state if row else None
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        await self._write(self._key(key), data=dict(data))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        row = await self._read(self._key(key))
+        return dict(row.data or {}) if row else {}
+
+    async def cleanup(self, older_than: timedelta) -> int:
+        # التدفقات المتروكة (بدأ المستخدم الإنشاء ولم يكمل)
+        async with AsyncSessionLocal() as session:
+            res = await session.execute(delete(FsmState).where(FsmState.updated_at < func.now() - older_than))
+            await session.commit()
+            return res.rowcount or 0
+
+    async def close(self) -> None:
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {"reads": self.reads, "writes": self.writes}
@@ -1 +1 @@
-from . import start_gate, menu, giveaway_create, participate, channel_log, stats, donate_stars, terms_privacy, admin, entry_actions
+from . import start_gate, menu, giveaway_create, participate, channel_log, stats, donate_stars, terms_privacy, admin, entry_actions, membership_events, export
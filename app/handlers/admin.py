@@ -1,11 +1,24 @@
 from __future__ import annotations
 
-from aiogram import Router, F
+import html
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+
+from aiogram import Router, Bot, F
 from aiogram.types import Message
+from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.broadcast import cancel_campaign, campaign_eta, create_campaign
+from app.channels import mandatory_channels
 from app.config import settings
-from app.models import User, Chat, AuditLog
+from app.live_counter import live_counter
+from app.moderation import (
+    EntryFilter, ban_chats, ban_users, count_ban_chats, count_ban_users, count_exclude_entries, exclude_entries,
+    parse_id_file, parse_id_list,
+)
+from app.models import User, Chat, AuditLog, BroadcastCampaign
+from app.user_cache import user_state_cache
 
 router = Router()
 
@@ -18,13 +31,13 @@ async def audit(session: AsyncSession, actor: int | None, action: str, entity: s
     session.add(AuditLog(actor_user_id=actor, action=action, entity=entity, entity_id=entity_id, detail=detail))
 
 
-@router.message(F.text.startswith("/ban_user"))
+@router.message(F.text.regexp(r"^/ban_user(\s|$)"))
 async def ban_user(message: Message, session: AsyncSession):
     if not is_admin(message.from_user.id):
         return
     parts = (message.text or "").split()
     if len(parts) != 2:
-        await message.answer("استخدم: /ban_user <user_id>")
+        await message.answer("استخدم: /ban_user &lt;user_id&gt;")
         return
     uid = int(parts[1])
     u = await session.get(User, uid)
@@ -34,16 +47,17 @@ async def ban_user(message: Message, session: AsyncSession):
     u.is_banned = True
     await audit(session, message.from_user.id, "ban_user", "user", str(uid), None)
     await session.commit()
+    user_state_cache.update(uid, is_banned=True)
     await message.answer("تم حظر المستخدم.")
 
 
-@router.message(F.text.startswith("/ban_chat"))
+@router.message(F.text.regexp(r"^/ban_chat(\s|$)"))
 async def ban_chat(message: Message, session: AsyncSession):
     if not is_admin(message.from_user.id):
         return
     parts = (message.text or "").split()
     if len(parts) != 2:
-        await message.answer("استخدم: /ban_chat <chat_id>")
+        await message.answer("استخدم: /ban_chat &lt;chat_id&gt;")
         return
     cid = int(parts[1])
     c = await session.get(Chat, cid)
@@ -55,3 +69,192 @@ async def ban_chat(message: Message, session: AsyncSession):
     await audit(session, message.from_user.id, "ban_chat", "chat", str(cid), None)
     await session.commit()
     await message.answer("تم حظر القناة/القروب.")
+
+
+@router.message(F.text == "/refresh_channels")
+async def refresh_channels(message: Message, bot: Bot, session: AsyncSession):
+    if not is_admin(message.from_user.id):
+        return
+    resolved = await mandatory_channels.refresh(bot)
+    await audit(session, message.from_user.id, "refresh_channels", "config", None, f"resolved={resolved}")
+    await session.commit()
+    lines = [f"{html.escape(ch.ref)} → {ch.chat_id if ch.chat_id is not None else 'غير محلولة'}" for ch in mandatory_channels.channels]
+    await message.answer("تم تحديث القنوات الإلزامية.\n" + "\n".join(lines) if lines else "لا توجد قنوات إلزامية.")
+
+
+@router.message(F.text.regexp(r"^/broadcast(\s|$)"))
+async def broadcast(message: Message, session: AsyncSession):
+    if not is_admin(message.from_user.id):
+        return
+    # html_text يحفظ التنسيق؛ أمر البوت نفسه يظهر فيه نصًا عاديًا
+    text = message.html_text[len("/broadcast"):].strip()
+    if not text:
+        await message.answer("استخدم: /broadcast &lt;النص&gt;")
+        return
+    c = await create_campaign(session, message.from_user.id, text)
+    await audit(session, message.from_user.id, "broadcast", "broadcast", str(c.id), f"total={c.total}")
+    await session.commit()
+    await message.answer(
+        f"تمت جدولة الإذاعة #{c.id} إلى {c.total} مستخدم.\n"
+        f"المتابعة: /broadcast_status {c.id}\nالإلغاء: /broadcast_cancel {c.id}"
+    )
+
+
+@router.message(F.text.startswith("/broadcast_status"))
+async def broadcast_status(message: Message, session: AsyncSession):
+    if not is_admin(message.from_user.id):
+        return
+    parts = (message.text or "").split()
+    q = select(BroadcastCampaign)
+    if len(parts) == 2 and parts[1].isdigit():
+        q = q.where(BroadcastCampaign.id == int(parts[1]))
+    c = (await session.execute(q.order_by(BroadcastCampaign.id.desc()).limit(1))).scalar_one_or_none()
+    if not c:
+        await message.answer("لا توجد إذاعة.")
+        return
+    eta = campaign_eta(c)
+    lines = [
+        f"الإذاعة #{c.id}: {c.status}",
+        f"أُرسلت: {c.sent} / {c.total}",
+        f"فشلت: {c.failed}",
+        f"محظور: {c.blocked}",
+    ]
+    if eta is not None:
+        lines.append(f"الوقت المتبقي: {timedelta(seconds=eta)}")
+    await message.answer("\n".join(lines))
+
+
+@router.message(F.text.startswith("/broadcast_cancel"))
+async def broadcast_cancel(message: Message, session: AsyncSession):
+    if not is_admin(message.from_user.id):
+        return
+    parts = (message.text or "").split()
+    if len(parts) != 2 or not parts[1].isdigit():
+        await message.answer("استخدم: /broadcast_cancel &lt;id&gt;")
+        return
+    cid = int(parts[1])
+    if not await cancel_campaign(session, cid):
+        await message.answer("الإذاعة غير موجودة أو انتهت.")
+        return
+    await audit(session, message.from_user.id, "broadcast_cancel", "broadcast", str(cid), None)
+    await session.commit()
+    await message.answer("تم إلغاء الإذاعة.")
+
+
+async def _bulk_args(message: Message, bot: Bot) -> Tuple[List[str], bool, str]:
+    # الأمر في النص، أو في وصف ملف (txt/csv) فيه المعرّفات
+    args = (message.text or message.caption or "").split()[1:]
+    dry_run = "dry" in args
+    args = [a for a in args if a != "dry"]
+    uploaded = ""
+    if message.document:
+        buf = await bot.download(message.document)
+        uploaded = buf.read().decode("utf-8", "ignore")
+    return args, dry_run, uploaded
+
+
+def _parse_time(value: str) -> Optional[datetime]:
+    try:
+        t = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    return t if t.tzinfo else t.replace(tzinfo=timezone.utc)
+
+
+def _bulk_reply(dry_run: bool, count: int, bad: int) -> str:
+    out = f"تجربة: سيتأثر {count}." if dry_run else f"تم: {count}."
+    if bad:
+        out += f"\nتم تجاهل {bad} قيمة/سطر غير صالح."
+    return out
+
+
+def _bulk_ids(args: List[str], uploaded: str, column: str) -> Tuple[List[int], int]:
+    ids, bad = parse_id_list(" ".join(args))
+    file_ids, file_bad = parse_id_file(uploaded, column)
+    return list(dict.fromkeys(ids + file_ids)), bad + file_bad
+
+
+@router.message(F.text.startswith("/ban_users"))
+@router.message(F.caption.startswith("/ban_users"))
+async def ban_users_bulk(message: Message, bot: Bot, session: AsyncSession):
+    if not is_admin(message.from_user.id):
+        return
+    args, dry_run, uploaded = await _bulk_args(message, bot)
+    ids, bad = _bulk_ids(args, uploaded, "user_id")
+    if not ids:
+        await message.answer(
+            "استخدم: /ban_users [dry] &lt;user_id...&gt; أو أرسل ملفًا بمعرّف واحد في كل سطر مع الأمر في الوصف"
+        )
+        return
+    if dry_run:
+        await message.answer(_bulk_reply(True, await count_ban_users(session, ids), bad))
+        return
+    changed = await ban_users(session, message.from_user.id, ids)
+    await session.commit()
+    # بعد commit فقط: قراءة متزامنة قبلها قد تعيد الحالة القديمة للكاش
+    user_state_cache.invalidate_many(changed)
+    await message.answer(_bulk_reply(False, len(changed), bad))
+
+
+@router.message(F.text.startswith("/ban_chats"))
+@router.message(F.caption.startswith("/ban_chats"))
+async def ban_chats_bulk(message: Message, bot: Bot, session: AsyncSession):
+    if not is_admin(message.from_user.id):
+        return
+    args, dry_run, uploaded = await _bulk_args(message, bot)
+    ids, bad = _bulk_ids(args, uploaded, "chat_id")
+    if not ids:
+        await message.answer(
+            "استخدم: /ban_chats [dry] &lt;chat_id...&gt; أو أرسل ملفًا بمعرّف واحد في كل سطر مع الأمر في الوصف"
+        )
+        return
+    if dry_run:
+        await message.answer(_bulk_reply(True, await count_ban_chats(session, ids), bad))
+        return
+    count = await ban_chats(session, message.from_user.id, ids)
+    await session.commit()
+    await message.answer(_bulk_reply(False, count, bad))
+
+
+@router.message(F.text.startswith("/exclude_entries"))
+@router.message(F.caption.startswith("/exclude_entries"))
+async def exclude_entries_bulk(message: Message, bot: Bot, session: AsyncSession):
+    if not is_admin(message.from_user.id):
+        return
+    usage = (
+        "استخدم: /exclude_entries [dry] &lt;giveaway_id&gt; [users=1,2] [entries=5,6] "
+        "[users_after=2026-01-31T12:00] [entered_after=...]\n"
+        "أو أرسل ملفًا بمعرّف مستخدم واحد في كل سطر مع الأمر في الوصف"
+    )
+    args, dry_run, uploaded = await _bulk_args(message, bot)
+    if not args or not args[0].isdigit():
+        await message.answer(usage)
+        return
+    user_ids, bad = parse_id_file(uploaded, "user_id")
+    flt = EntryFilter(giveaway_id=int(args[0]), user_ids=user_ids)
+    for arg in args[1:]:
+        key, _, value = arg.partition("=")
+        if key in ("users", "entries"):
+            ids, bad_here = parse_id_list(value)
+            bad += bad_here
+            if key == "users":
+                flt.user_ids = list(dict.fromkeys(flt.user_ids + ids))
+            else:
+                flt.entry_ids = ids
+        elif key in ("users_after", "entered_after") and _parse_time(value):
+            setattr(flt, key, _parse_time(value))
+        else:
+            await message.answer(usage)
+            return
+    # بلا شرط يعني كل مشاركات السحب؛ لا نسمح بذلك خطأً
+    if not (flt.user_ids or flt.entry_ids or flt.users_after or flt.entered_after):
+        await message.answer(usage)
+        return
+    if dry_run:
+        await message.answer(_bulk_reply(True, await count_exclude_entries(session, flt), bad))
+        return
+    count = await exclude_entries(session, message.from_user.id, flt)
+    await session.commit()
+    if count:
+        live_counter.touch(flt.giveaway_id)
+    await message.answer(_bulk_reply(False, count, bad))
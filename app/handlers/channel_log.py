@@ -11,6 +11,7 @@ from app.keyboards import pick_chat_kb, back_kb, menu_kb
 from app.texts import CHANNEL_LOG_ENTRY_TEXT, REGISTER_CHAT_INSTRUCTIONS
 from app.utils import extract_forwarded_chat_id, ensure_bot_admin
 from app.models import ChannelLog
+from app.log_outbox import invalidate_log_chat
 
 router = Router()
 
@@ -81,6 +82,7 @@ async def on_forward_logchat(message: Message, bot: Bot, session: AsyncSession,
     )
     await session.merge(chlog)
     await session.commit()
+    invalidate_log_chat(source_chat_id)
 
     await message.answer("تم اختيار قناة السجل بنجاح", reply_markup=menu_kb())
     await state.clear()
@@ -2,9 +2,11 @@ from __future__ import annotations
 
 from aiogram import Router, F
 from aiogram.types import CallbackQuery
+from sqlalchemy import update
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.models import Entry, AuditLog
+from app.models import Entry, Giveaway, AuditLog
+from app.live_counter import live_counter
 
 router = Router()
 
@@ -26,9 +28,21 @@ async def exclude_entry(cb: CallbackQuery, session: AsyncSession):
         await cb.answer("غير موجود.", show_alert=True)
         return
 
-    if not e.excluded:
-        e.excluded = True
+    # التحديث المشروط يضمن زيادة excluded_count مرة واحدة حتى مع ضغطتين متزامنتين
+    changed = (await session.execute(
+        update(Entry)
+        .where(Entry.id == entry_id, Entry.excluded == False)
+        .values(excluded=True)
+        .returning(Entry.id)
+    )).scalar_one_or_none()
+    if changed:
+        await session.execute(
+            update(Giveaway)
+            .where(Giveaway.id == e.giveaway_id)
+            .values(excluded_count=Giveaway.excluded_count + 1)
+        )
         await audit(session, cb.from_user.id, "exclude", "entry", str(entry_id), None)
         await session.commit()
+        live_counter.touch(e.giveaway_id)
 
     await cb.answer("تم استبعاده", show_alert=True)
@@ -0,0 +1,36 @@
+from __future__ import annotations
+
+from aiogram import Router, Bot, F
+from aiogram.types import Message
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.export import FORMATS, request_export
+from app.models import Giveaway
+
+router = Router()
+
+
+@router.message(F.text.startswith("/export"))
+async def export_giveaway(message: Message, bot: Bot, session: AsyncSession):
+    # قائمة المشاركين (معرّفات ويوزرات) لا تُرسل إلا في الخاص
+    if message.chat.type != "private":
+        await message.answer("أرسل الأمر في محادثة خاصة مع البوت.")
+        return
+    parts = (message.text or "").split()
+    if len(parts) not in (2, 3) or not parts[1].isdigit() or (len(parts) == 3 and parts[2] not in FORMATS):
+        await message.answer("استخدم: /export &lt;giveaway_id&gt; [csv|jsonl]")
+        return
+    gid = int(parts[1])
+    fmt = parts[2] if len(parts) == 3 else "csv"
+
+    g = await session.get(Giveaway, gid)
+    uid = message.from_user.id
+    if not g or (g.creator_user_id != uid and uid not in settings.admin_ids_list):
+        await message.answer("غير موجود.")
+        return
+
+    if not request_export(bot, uid, gid, fmt):
+        await message.answer("التصدير جارٍ بالفعل.")
+        return
+    await message.answer("جارٍ تجهيز الملف، سيصلك خلال لحظات.")
@@ -18,8 +18,9 @@ from app.texts import (
     ASK_AUTO_DRAW_THRESHOLD_TEXT, ASK_PREMIUM_ONLY_TEXT, PUBLISHED_TEXT
 )
 from app.models import Chat, Giveaway, AuditLog
-from app.utils import extract_forwarded_chat_id, ensure_bot_admin, ensure_bot_admin_with_member_mgmt
+from app.utils import extract_forwarded_chat, ensure_bot_admin, ensure_bot_admin_with_member_mgmt, resolve_chat
 from app.keyboards import participate_button
+from app.membership import membership_cache
 
 router = Router()
 
@@ -50,18 +51,18 @@ async def create_register_target(cb: CallbackQuery, state: FSMContext):
 
 @router.message(CreateFlow.waiting_forward_target)
 async def on_forward_target(message: Message, bot: Bot, session: AsyncSession, state: FSMContext):
-    chat_id = extract_forwarded_chat_id(message)
-    if not chat_id:
+    # الرسالة المعاد توجيهها تحمل بيانات الجهة، فلا حاجة لـ get_chat
+    tg_chat = extract_forwarded_chat(message)
+    if not tg_chat:
         await message.answer("أعد توجيه رسالة من القناة/القروب المطلوب.")
         return
+    chat_id = tg_chat.id
 
     ok, err = await ensure_bot_admin(bot, chat_id)
     if not ok:
         await message.answer(err)
         return
 
-    tg_chat = await bot.get_chat(chat_id)
-
     c = await session.get(Chat, chat_id)
     if not c:
         c = Chat(id=chat_id, type=tg_chat.type, title=tg_chat.title, username=tg_chat.username)
@@ -154,7 +155,7 @@ async def on_cond_channels(message: Message, bot: Bot, session: AsyncSession, st
             await message.answer("أرسل يوزر قناة الشرط مثل @X")
             return
         try:
-            chat = await bot.get_chat(username)
+            chat = await resolve_chat(bot, username)
         except Exception:
             await message.answer("تعذر العثور على القناة. تأكد من اليوزر.")
             return
@@ -164,6 +165,7 @@ async def on_cond_channels(message: Message, bot: Bot, session: AsyncSession, st
             await message.answer(err)
             return
 
+        await membership_cache.track_chat(chat.id)
         chat_ids.append(chat.id)
 
     c1 = chat_ids[0] if len(chat_ids) >= 1 else None
@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+from aiogram import Router, Bot
+from aiogram.types import ChatMemberUpdated, Chat
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.channels import mandatory_channels
+from app.membership import membership_cache, NEGATIVE_STATUSES
+from app.models import User
+from app.handlers.start_gate import user_in_all_mandatory
+from app.user_cache import user_state_cache
+from app.utils import get_bot_member, remember_bot_member
+
+router = Router()
+
+
+def is_mandatory_chat(chat: Chat) -> bool:
+    return mandatory_channels.is_mandatory(chat.id, chat.username)
+
+
+async def track_mandatory_channels(bot: Bot) -> None:
+    for chat_id in mandatory_channels.chat_ids():
+        try:
+            cm = await get_bot_member(bot, chat_id)
+        except Exception:
+            continue
+        if cm.status in ("administrator", "creator"):
+            await membership_cache.track_chat(chat_id)
+
+
+@router.my_chat_member()
+async def on_bot_membership(event: ChatMemberUpdated):
+    remember_bot_member(event.chat.id, event.new_chat_member)
+    if event.new_chat_member.status in ("administrator", "creator"):
+        await membership_cache.track_chat(event.chat.id)
+    else:
+        await membership_cache.untrack_chat(event.chat.id)
+
+
+@router.chat_member()
+async def on_chat_member(event: ChatMemberUpdated, bot: Bot, session: AsyncSession):
+    chat_id = event.chat.id
+    user_id = event.new_chat_member.user.id
+    status = event.new_chat_member.status
+
+    # وصول الحدث يعني أن البوت مشرف هنا
+    await membership_cache.track_chat(chat_id)
+    await membership_cache.store(chat_id, user_id, status, permanent=True)
+
+    if not is_mandatory_chat(event.chat):
+        return
+
+    if status in NEGATIVE_STATUSES:
+        await session.execute(
+            update(User)
+            .where(User.id == user_id, User.gate_verified == True, User.suspended == False)
+            .values(suspended=True)
+        )
+        await session.commit()
+        user_state_cache.invalidate(user_id)
+        return
+
+    u = await session.get(User, user_id)
+    if u and u.suspended and u.gate_verified and await user_in_all_mandatory(bot, user_id):
+        u.suspended = False
+        await session.commit()
+        user_state_cache.update(user_id, suspended=False)
@@ -1,32 +1,69 @@
 from __future__ import annotations
 
 import time
+from typing import Optional
+
 from aiogram import Router, Bot, F
 from aiogram.types import CallbackQuery
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
+from sqlalchemy import BigInteger, Boolean, Integer, String, exists, literal, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.engine import Row
 
 from app.security import verify_payload
-from app.models import Giveaway, Entry, User, ChannelLog, AuditLog
-from app.keyboards import entry_admin_kb
-from app.texts import LOG_ENTRY_NEW
+from app.models import Giveaway, Entry
+from app.audit import audit_buffer
+from app.log_outbox import channel_log_outbox, get_log_chat_id, LogItem
+from app.live_counter import live_counter
+from app.membership import membership_cache
+from app.scheduler import request_draw
+from app.user_cache import load_user_state
 
 router = Router()
 
-_last_click = {}  # (user_id, giveaway_id) -> ts
-
-
-async def audit(session: AsyncSession, actor: int | None, action: str, entity: str, entity_id: str | None, detail: str | None):
-    session.add(AuditLog(actor_user_id=actor, action=action, entity=entity, entity_id=entity_id, detail=detail))
-
 
 async def check_user_gate(session: AsyncSession, user_id: int) -> bool:
-    u = await session.get(User, user_id)
-    if not u or u.is_banned:
-        return False
-    if not u.gate_verified or u.suspended:
-        return False
-    return True
+    state = await load_user_state(session, user_id)
+    return state is not None and state.can_participate
+
+
+async def admit_entry(session: AsyncSession, giveaway_id: int, user_id: int, username: str | None) -> tuple[str, Optional[Row]]:
+    # رحلة واحدة لقاعدة البيانات: زيادة العداد + الإدخال في جملة واحدة.
+    # المكرر لا يزيد العداد (NOT EXISTS)، وفي سباق نادر يُلغى كل شيء بالـ rollback
+    bump = (
+        update(Giveaway)
+        .where(
+            Giveaway.id == giveaway_id,
+            Giveaway.is_drawn == False,
+            ~exists().where(Entry.giveaway_id == giveaway_id, Entry.user_id == user_id),
+        )
+        .values(entries_count=Giveaway.entries_count + 1)
+        .returning(Giveaway.entries_count.label("seq_no"))
+        .cte("bump")
+    )
+    stmt = (
+        insert(Entry)
+        .from_select(
+            ["giveaway_id", "user_id", "username", "seq_no", "excluded"],
+            select(
+                literal(giveaway_id, Integer),
+                literal(user_id, BigInteger),
+                literal(username, String),
+                bump.c.seq_no,
+                literal(False, Boolean),
+            ),
+        )
+        .on_conflict_do_nothing(index_elements=[Entry.giveaway_id, Entry.user_id])
+        .returning(Entry.id, Entry.seq_no)
+    )
+    row = (await session.execute(stmt)).first()
+    if row is None:
+        await session.rollback()
+        # لم يُدخل شيء: إما مشارك من قبل، أو سُحب بين الفحص والإدخال
+        drawn = (await session.execute(select(Giveaway.is_drawn).where(Giveaway.id == giveaway_id))).scalar()
+        return ("drawn" if drawn else "duplicate"), None
+    await session.commit()
+    return "admitted", row
 
 
 async def conditions_ok(bot: Bot, g: Giveaway, cb: CallbackQuery) -> tuple[bool, str]:
@@ -36,8 +73,7 @@ async def conditions_ok(bot: Bot, g: Giveaway, cb: CallbackQuery) -> tuple[bool,
     for cond in (g.cond_channel_1, g.cond_channel_2):
         if cond:
             try:
-                cm = await bot.get_chat_member(cond, cb.from_user.id)
-                if cm.status in ("left", "kicked"):
+                if not await membership_cache.is_member(bot, cond, cb.from_user.id):
                     return False, "يجب استيفاء شروط الاشتراك في قناة الشرط."
             except Exception:
                 return False, "تعذر التحقق من شروط القناة الآن."
@@ -57,12 +93,6 @@ async def participate(cb: CallbackQuery, bot: Bot, session: AsyncSession):
         return
 
     giveaway_id = int(data["g"])
-    now = time.time()
-    key = (cb.from_user.id, giveaway_id)
-    if now - _last_click.get(key, 0) < 2.0:
-        await cb.answer("تمهل قليلًا.", show_alert=False)
-        return
-    _last_click[key] = now
 
     if not await check_user_gate(session, cb.from_user.id):
         await cb.answer("يجب إتمام بوابة الاشتراك أولًا.", show_alert=True)
@@ -81,44 +111,31 @@ async def participate(cb: CallbackQuery, bot: Bot, session: AsyncSession):
         await cb.answer(err, show_alert=True)
         return
 
-    seq_no = (await session.execute(
-        select(func.count(Entry.id)).where(Entry.giveaway_id == g.id)
-    )).scalar_one() + 1
-
-    e = Entry(
-        giveaway_id=g.id,
-        user_id=cb.from_user.id,
-        username=cb.from_user.username,
-        seq_no=seq_no,
-        excluded=False,
-    )
-    session.add(e)
-    try:
-        await session.commit()
-    except Exception:
-        await session.rollback()
+    outcome, entry = await admit_entry(session, g.id, cb.from_user.id, cb.from_user.username)
+    if outcome == "drawn":
+        await cb.answer("انتهى السحب.", show_alert=True)
+        return
+    if entry is None:
         await cb.answer("أنت مشارك بالفعل.", show_alert=True)
         return
+    seq_no = entry.seq_no
 
-    await audit(session, cb.from_user.id, "entry_create", "giveaway", str(g.id), f"seq={seq_no}")
-    await session.commit()
+    audit_buffer.add(cb.from_user.id, "entry_create", "giveaway", str(g.id), f"seq={seq_no}")
 
     await cb.answer("تمت المشاركة.", show_alert=False)
 
-    chlog = await session.get(ChannelLog, g.target_chat_id)
-    if chlog:
-        text = (
-            f"{LOG_ENTRY_NEW}\n"
-            f"{('@' + cb.from_user.username) if cb.from_user.username else 'بدون يوزر'}\n"
-            f"{cb.from_user.id}\n"
-            f"{int(time.time())}\n"
-            f"عدد المشاركين: {seq_no}"
-        )
-        try:
-            await bot.send_message(
-                chat_id=chlog.log_chat_id,
-                text=text,
-                reply_markup=entry_admin_kb(cb.from_user.id, e.id),
-            )
-        except Exception:
-            pass
+    active = seq_no - (g.excluded_count or 0)
+    if g.auto_draw_enabled and g.auto_draw_entries_threshold and active >= g.auto_draw_entries_threshold:
+        request_draw(bot, g.id)
+
+    live_counter.note(g.id, g.target_chat_id, g.published_message_id, cb.data)
+
+    log_chat_id = await get_log_chat_id(session, g.target_chat_id)
+    if log_chat_id:
+        channel_log_outbox.enqueue(log_chat_id, LogItem(
+            user_id=cb.from_user.id,
+            username=cb.from_user.username,
+            entry_id=entry.id,
+            seq_no=seq_no,
+            ts=int(time.time()),
+        ))
@@ -2,55 +2,31 @@ from __future__ import annotations
 
 from aiogram import Router, Bot, F
 from aiogram.types import Message, CallbackQuery
+from sqlalchemy import update
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.models import User
 from app.keyboards import gate_kb, menu_kb
 from app.texts import GATE_TEXT, MENU_TEXT, POPUP_ENABLED_NOTIFY, NOTIFY_INFO
-from app.config import settings
+from app.channels import mandatory_channels
+from app.membership import membership_cache
+from app.user_cache import upsert_user, user_state_cache
 
 router = Router()
 
 
-async def upsert_user(session: AsyncSession, tg_user) -> User:
-    u = await session.get(User, tg_user.id)
-    if not u:
-        u = User(
-            id=tg_user.id,
-            username=tg_user.username,
-            language=tg_user.language_code,
-        )
-        session.add(u)
-        await session.commit()
-        await session.refresh(u)
-    else:
-        changed = False
-        if u.username != tg_user.username:
-            u.username = tg_user.username
-            changed = True
-        if u.language != tg_user.language_code:
-            u.language = tg_user.language_code
-            changed = True
-        if changed:
-            await session.commit()
-    return u
-
-
-async def user_in_all_mandatory(bot: Bot, user_id: int) -> bool:
-    if not settings.mandatory_channels_list:
+async def user_in_all_mandatory(bot: Bot, user_id: int, fresh: bool = False) -> bool:
+    if not mandatory_channels.configured:
         return True
 
-    for ch in settings.mandatory_channels_list:
+    if not mandatory_channels.fully_resolved:
+        await mandatory_channels.refresh(bot, only_missing=True)
+        if not mandatory_channels.fully_resolved:
+            return False
+
+    for chat_id in mandatory_channels.chat_ids():
         try:
-            if ch.startswith("@"):
-                chat = await bot.get_chat(ch)
-            elif "t.me/" in ch:
-                username = ch.split("t.me/")[-1].split("?")[0].strip("/")
-                chat = await bot.get_chat(f"@{username}")
-            else:
-                return False
-            cm = await bot.get_chat_member(chat.id, user_id)
-            if cm.status in ("left", "kicked"):
+            if not await membership_cache.is_member(bot, chat_id, user_id, fresh=fresh):
                 return False
         except Exception:
             return False
@@ -77,14 +53,15 @@ async def gate_check(cb: CallbackQuery, bot: Bot, session: AsyncSession):
         await cb.answer("موقوف.", show_alert=True)
         return
 
-    ok = await user_in_all_mandatory(bot, u.id)
+    # المستخدم ضغط "لقد اشتركت" للتو، فلا نعتمد على نتيجة سلبية مخزنة
+    ok = await user_in_all_mandatory(bot, u.id, fresh=True)
     if not ok:
         await cb.answer("لم يتم العثور على اشتراكك في القنوات الإلزامية.", show_alert=True)
         return
 
-    u.gate_verified = True
-    u.suspended = False
+    await session.execute(update(User).where(User.id == u.id).values(gate_verified=True, suspended=False))
     await session.commit()
+    user_state_cache.update(u.id, gate_verified=True, suspended=False)
 
     await cb.message.edit_text(MENU_TEXT, reply_markup=menu_kb())
     await cb.answer("تم التحقق بنجاح.", show_alert=False)
@@ -96,7 +73,7 @@ async def toggle_notify(cb: CallbackQuery, session: AsyncSession):
     if u.is_banned:
         await cb.answer("موقوف.", show_alert=True)
         return
-    u.notify_on_win = True
+    await session.execute(update(User).where(User.id == u.id).values(notify_on_win=True))
     await session.commit()
     await cb.answer(POPUP_ENABLED_NOTIFY, show_alert=True)
     try:
@@ -1,33 +1,54 @@
 from __future__ import annotations
 
+import time
+from typing import List, Optional, Tuple
+
 from aiogram import Router, F
 from aiogram.types import CallbackQuery
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func, desc
 
+from app.config import settings
 from app.models import Entry, Giveaway
 from app.keyboards import menu_kb
 
 router = Router()
 
+# الترتيب نفسه لكل المستخدمين، فيُحسب مرة كل STATS_CACHE_SECONDS لكل عملية
+_top_cache: Optional[Tuple[List[Tuple[int, int]], float]] = None
+
+
+async def top_chats(session: AsyncSession) -> List[Tuple[int, int]]:
+    global _top_cache
+    now = time.monotonic()
+    if _top_cache and _top_cache[1] > now:
+        return _top_cache[0]
+    # من عدادات giveaways (تُحدَّث مع كل إدخال) بدل تجميع جدول entries
+    cnt = func.sum(Giveaway.entries_count).label("cnt")
+    rows = (await session.execute(
+        select(Giveaway.target_chat_id, cnt)
+        .where(Giveaway.entries_count > 0)
+        .group_by(Giveaway.target_chat_id)
+        .order_by(desc(cnt))
+        .limit(10)
+    )).all()
+    top = [(r.target_chat_id, int(r.cnt)) for r in rows]
+    _top_cache = (top, now + settings.stats_cache_seconds)
+    return top
+
 
 @router.callback_query(F.data == "menu:stats")
 async def stats(cb: CallbackQuery, session: AsyncSession):
+    # فهرس (user_id, giveaway_id) يجعل جانب entries قراءة من الفهرس فقط
     q1 = await session.execute(
-        select(func.count(Entry.id))
+        select(func.count())
+        .select_from(Entry)
         .join(Giveaway, Giveaway.id == Entry.giveaway_id)
         .where(Entry.user_id == cb.from_user.id, Giveaway.is_drawn == False)
     )
     current = q1.scalar_one()
 
-    q2 = await session.execute(
-        select(Giveaway.target_chat_id, func.count(Entry.id).label("cnt"))
-        .join(Entry, Entry.giveaway_id == Giveaway.id)
-        .group_by(Giveaway.target_chat_id)
-        .order_by(desc("cnt"))
-        .limit(10)
-    )
-    top = q2.all()
+    top = await top_chats(session)
 
     text = f"عدد السحوبات التي أنا مشترك فيها حاليًا: {current}\n\nأفضل 10 قنوات (حسب عدد المشاركات داخل البوت):\n"
     for chat_id, cnt in top:
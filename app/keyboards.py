@@ -1,17 +1,19 @@
 from __future__ import annotations
 
 import time
+from typing import Optional, Sequence, Tuple
+
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder
+from app.channels import mandatory_channels
 from app.config import settings
 from app.security import sign_payload
 
 
 def gate_kb() -> InlineKeyboardMarkup:
     b = InlineKeyboardBuilder()
-    if settings.mandatory_channels_list:
-        ch = settings.mandatory_channels_list[0]
-        url = ch if ch.startswith("http") else f"https://t.me/{ch.lstrip('@')}"
+    url = mandatory_channels.gate_url()
+    if url:
         b.add(InlineKeyboardButton(text="القناة", url=url))
     else:
         b.add(InlineKeyboardButton(text="القناة", callback_data="noop"))
@@ -77,11 +79,13 @@ def auto_draw_type_kb() -> InlineKeyboardMarkup:
     ])
 
 
-def participate_button(giveaway_id: int) -> InlineKeyboardMarkup:
-    payload = {"g": giveaway_id, "ts": int(time.time()), "n": "p"}
-    token = sign_payload(payload)
+def participate_button(giveaway_id: int, count: Optional[int] = None, callback_data: Optional[str] = None) -> InlineKeyboardMarkup:
+    if callback_data is None:
+        payload = {"g": giveaway_id, "ts": int(time.time()), "n": "p"}
+        callback_data = f"p:{sign_payload(payload)}"
+    text = "مشاركة" if count is None else f"مشاركة ({count})"
     return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="مشاركة", callback_data=f"p:{token}")]
+        [InlineKeyboardButton(text=text, callback_data=callback_data)]
     ])
 
 
@@ -92,3 +96,12 @@ def entry_admin_kb(user_id: int, entry_id: int) -> InlineKeyboardMarkup:
             InlineKeyboardButton(text="❌ استبعاد", callback_data=f"entry:exclude:{entry_id}"),
         ]
     ])
+
+
+def digest_exclude_kb(entries: Sequence[Tuple[int, int]]) -> InlineKeyboardMarkup:
+    # زر استبعاد لكل سطر في الملخّص: (seq_no, entry_id)، خمسة في كل صف
+    buttons = [
+        InlineKeyboardButton(text=f"❌ #{seq_no}", callback_data=f"entry:exclude:{entry_id}")
+        for seq_no, entry_id in entries
+    ]
+    return InlineKeyboardMarkup(inline_keyboard=[buttons[i:i + 5] for i in range(0, len(buttons), 5)])
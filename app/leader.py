@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+import asyncio
+import functools
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+from sqlalchemy import func, select, text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, AsyncSession
+
+from app.config import settings
+from app.db import engine
+
+log = logging.getLogger(__name__)
+
+# مساحات أسماء أقفال advisory (المفتاح الأول من الزوج)
+DRAW_LOCK_NS = settings.leader_lock_id + 1
+
+T = TypeVar("T")
+
+
+async def try_draw_lock(session: AsyncSession, giveaway_id: int) -> bool:
+    # قفل على مستوى المعاملة: يُحرر تلقائيًا مع commit/rollback
+    return bool((await session.execute(
+        select(func.pg_try_advisory_xact_lock(DRAW_LOCK_NS, giveaway_id))
+    )).scalar())
+
+
+class LeaderElection:
+    # القفل مرتبط باتصال مفتوح: إذا ماتت العملية أو انقطع الاتصال يحرره Postgres ويأخذه عامل آخر
+    def __init__(self, engine: AsyncEngine, lock_id: int, check_seconds: float):
+        self.engine = engine
+        self.lock_id = lock_id
+        self.check_seconds = max(check_seconds, 1)
+        self.is_leader = False
+        self.leader_since: Optional[float] = None
+        self.elections = 0
+        self._conn: Optional[AsyncConnection] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def _try_acquire(self) -> bool:
+        conn = await self.engine.connect()
+        try:
+            got = (await conn.execute(select(func.pg_try_advisory_lock(self.lock_id, 0)))).scalar()
+            # لا نترك معاملة مفتوحة على اتصال القفل
+            await conn.commit()
+        except Exception:
+            await conn.close()
+            raise
+        if not got:
+            await conn.close()
+            return False
+        self._conn = conn
+        return True
+
+    async def _still_held(self) -> bool:
+        # SELECT 1 لا يكفي: لو أعاد SQLAlchemy الاتصال بصمت فالقفل قد ذهب مع الاتصال القديم
+        try:
+            held = (await self._conn.execute(text(
+                "SELECT EXISTS (SELECT 1 FROM pg_locks WHERE locktype = 'advisory' AND classid = :ns "
+                "AND objid = 0 AND pid = pg_backend_pid() AND granted)"
+            ), {"ns": self.lock_id})).scalar()
+            await self._conn.commit()
+            return bool(held)
+        except Exception:
+            return False
+
+    async def _become_follower(self) -> None:
+        was_leader = self.is_leader
+        self.is_leader = False
+        self.leader_since = None
+        if self._conn is not None:
+            try:
+                await self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
+        if was_leader:
+            log.warning("Lost scheduler leadership (pid %s)", os.getpid())
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                if not self.is_leader:
+                    if await self._try_acquire():
+                        self.is_leader = True
+                        self.leader_since = time.time()
+                        self.elections += 1
+                        log.info("Became scheduler leader (pid %s)", os.getpid())
+                elif not await self._still_held():
+                    await self._become_follower()
+                    continue
+            except Exception:
+                log.exception("Leader election round failed")
+                await self._become_follower()
+            await asyncio.sleep(self.check_seconds)
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._conn is not None:
+            try:
+                await self._conn.execute(select(func.pg_advisory_unlock(self.lock_id, 0)))
+                await self._conn.commit()
+            except Exception:
+                pass
+        await self._become_follower()
+
+    async def status(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {
+            "is_leader": self.is_leader,
+            "worker_pid": os.getpid(),
+            "leader_since": int(self.leader_since) if self.leader_since else None,
+            "elections": self.elections,
+            "leader": None,
+        }
+        # من يملك القفل الآن، حتى لو كان عاملًا آخر أو خادمًا آخر
+        try:
+            async with self.engine.connect() as conn:
+                row = (await conn.execute(text(
+                    "SELECT a.pid, a.client_addr::text AS client_addr, a.backend_start "
+                    "FROM pg_locks l JOIN pg_stat_activity a ON a.pid = l.pid "
+                    "WHERE l.locktype = 'advisory' AND l.classid = :ns AND l.objid = 0 AND l.granted"
+                ), {"ns": self.lock_id})).first()
+            if row:
+                out["leader"] = {
+                    "backend_pid": row.pid,
+                    "client_addr": row.client_addr,
+                    "connected_at": row.backend_start.isoformat() if row.backend_start else None,
+                }
+        except Exception:
+            pass
+        return out
+
+
+leader = LeaderElection(engine, settings.leader_lock_id, settings.leader_check_seconds)
+
+
+def leader_only(fn: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[Optional[T]]]:
+    # المهام الدورية المشتركة (فحص العضوية، السحب، التنظيف) تعمل في القائد فقط؛
+    # مهام الذاكرة المحلية لكل عامل لا تستخدم هذا
+    @functools.wraps(fn)
+    async def wrapper(*args: Any, **kwargs: Any) -> Optional[T]:
+        if settings.leader_election_enabled and not leader.is_leader:
+            return None
+        return await fn(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,204 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Any, Dict, Optional, Set
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+from sqlalchemy import func, or_, select, update
+
+from app.config import settings
+from app.db import AsyncSessionLocal
+from app.keyboards import participate_button
+from app.models import Giveaway
+from app.outbound import outbound_priority
+
+log = logging.getLogger(__name__)
+
+
+@dataclass
+class _Post:
+    chat_id: int
+    message_id: int
+    callback_data: str
+
+
+_PERMANENT_ERRORS = ("message to edit not found", "message can't be edited", "chat not found", "message_id_invalid")
+
+
+def _is_permanent(e: Exception) -> bool:
+    if isinstance(e, TelegramForbiddenError):
+        return True
+    return isinstance(e, TelegramBadRequest) and any(m in str(e).lower() for m in _PERMANENT_ERRORS)
+
+
+def _count():
+    return Giveaway.entries_count - Giveaway.excluded_count
+
+
+class LiveCounter:
+    # عدّاد المشاركين على زر المنشور: تعديل واحد على الأكثر لكل سحب كل interval ثانية.
+    # وقت آخر تعديل وآخر عدد ظاهر في صف السحب نفسه، فالحد مشترك بين كل العمال
+    def __init__(self, interval: float):
+        self.interval = max(interval, 1)
+        self.bot: Optional[Bot] = None
+        self._posts: Dict[int, _Post] = {}
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self._dirty: Set[int] = set()
+        # منشورات لا يمكن تعديلها (حُذفت أو لا صلاحية)؛ لا نعيد تسجيلها مع الضغطات التالية
+        self._disabled: Set[int] = set()
+        self._last_edit: Dict[int, float] = {}
+        self.edits = 0
+        self.skipped = 0
+        self.deferred = 0
+        self.failed = 0
+
+    def start(self, bot: Bot) -> None:
+        self.bot = bot
+
+    def note(self, giveaway_id: int, chat_id: int, message_id: Optional[int], callback_data: str) -> None:
+        # نعيد استخدام callback_data نفسه حتى لا يتغير مفتاح التهدئة ولا عمر التوقيع
+        if self.bot is None or not message_id or giveaway_id in self._disabled:
+            return
+        self._posts[giveaway_id] = _Post(chat_id, message_id, callback_data)
+        self._schedule(giveaway_id)
+
+    def touch(self, giveaway_id: int) -> None:
+        # تغيّر العدد بغير مشاركة جديدة (استبعاد)؛ لا نعرف المنشور إلا إذا شارك أحد عبر هذه العملية
+        if giveaway_id in self._posts:
+            self._schedule(giveaway_id)
+
+    def _schedule(self, giveaway_id: int, delay: Optional[float] = None) -> None:
+        if giveaway_id in self._tasks:
+            # التعديل الجاري ربما قرأ العدد قبل هذا التغيير؛ نعيد الجدولة بعد انتهائه
+            self._dirty.add(giveaway_id)
+            return
+        if delay is None:
+            elapsed = time.monotonic() - self._last_edit.get(giveaway_id, 0.0)
+            delay = max(self.interval - elapsed, 0.5)
+        self._tasks[giveaway_id] = asyncio.create_task(self._flush_later(giveaway_id, delay))
+
+    async def _flush_later(self, giveaway_id: int, delay: float) -> None:
+        retry = False
+        try:
+            await asyncio.sleep(delay)
+            with outbound_priority("background"):
+                retry = await self._edit(giveaway_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.failed += 1
+            log.exception("Live counter update failed for giveaway %s", giveaway_id)
+        finally:
+            self._tasks.pop(giveaway_id, None)
+        if giveaway_id in self._posts:
+            if retry:
+                self._schedule(giveaway_id, self.interval)
+            elif giveaway_id in self._dirty:
+                self._schedule(giveaway_id)
+
+    async def _edit(self, giveaway_id: int) -> bool:
+        # يعيد True إذا يجب إعادة المحاولة بعد المهلة: عامل آخر عدّل قبل قليل والعدد تغيّر بعده، أو سبق تعديلُه تعديلَنا
+        post = self._posts.get(giveaway_id)
+        if post is None:
+            return False
+        self._dirty.discard(giveaway_id)
+        async with AsyncSessionLocal() as session:
+            claimed = (await session.execute(
+                update(Giveaway)
+                .where(
+                    Giveaway.id == giveaway_id,
+                    Giveaway.is_drawn == False,
+                    Giveaway.counter_shown.is_distinct_from(_count()),
+                    or_(
+                        Giveaway.counter_edited_at.is_(None),
+                        Giveaway.counter_edited_at < func.now() - timedelta(seconds=self.interval),
+                    ),
+                )
+                .values(counter_shown=_count(), counter_edited_at=func.now())
+                .returning(Giveaway.counter_shown, Giveaway.counter_edited_at)
+            )).first()
+            row = None
+            if claimed is None:
+                row = (await session.execute(
+                    select(Giveaway.is_drawn, Giveaway.counter_shown.is_distinct_from(_count()).label("stale"))
+                    .where(Giveaway.id == giveaway_id)
+                )).first()
+            await session.commit()
+        if claimed is None:
+            if row is None or row.is_drawn:
+                self.forget(giveaway_id)
+                return False
+            if row.stale:
+                self.deferred += 1
+                return True
+            self.skipped += 1
+            return False
+
+        count, edited_at = claimed
+        self._last_edit[giveaway_id] = time.monotonic()
+        try:
+            await self.bot.edit_message_reply_markup(
+                chat_id=post.chat_id,
+                message_id=post.message_id,
+                reply_markup=participate_button(giveaway_id, count=count, callback_data=post.callback_data),
+            )
+        except Exception as e:
+            if isinstance(e, TelegramBadRequest) and "not modified" in str(e).lower():
+                return False
+            if _is_permanent(e):
+                # المنشور حُذف أو فقد البوت صلاحية التعديل: لا فائدة من المحاولة مع كل ضغطة
+                log.warning("Live counter disabled for giveaway %s: %s", giveaway_id, e)
+                self.failed += 1
+                self.forget(giveaway_id)
+                self._disabled.add(giveaway_id)
+                return False
+            # العدد لم يظهر فعلًا؛ نمسحه حتى لا يُعد المنشور محدّثًا
+            await self._unmark(giveaway_id)
+            raise
+        self.edits += 1
+        # عامل آخر أخذ التعديل بعدنا (تعديلنا كان بطيئًا): ربما وصل تعديله أولًا وبقي عددنا الأقدم ظاهرًا،
+        # فنعيد التعديل بعد المهلة بالعدد الحالي
+        async with AsyncSessionLocal() as session:
+            overtaken = (await session.execute(
+                update(Giveaway)
+                .where(Giveaway.id == giveaway_id, Giveaway.counter_edited_at != edited_at)
+                .values(counter_shown=None)
+                .returning(Giveaway.id)
+            )).scalar_one_or_none()
+            await session.commit()
+        return overtaken is not None
+
+    async def _unmark(self, giveaway_id: int) -> None:
+        async with AsyncSessionLocal() as session:
+            await session.execute(update(Giveaway).where(Giveaway.id == giveaway_id).values(counter_shown=None))
+            await session.commit()
+
+    def forget(self, giveaway_id: int) -> None:
+        self._posts.pop(giveaway_id, None)
+        self._dirty.discard(giveaway_id)
+        self._last_edit.pop(giveaway_id, None)
+
+    async def stop(self) -> None:
+        tasks = list(self._tasks.values())
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "tracked": len(self._posts),
+            "disabled": len(self._disabled),
+            "scheduled": len(self._tasks),
+            "edits": self.edits,
+            "skipped": self.skipped,
+            "deferred": self.deferred,
+            "failed": self.failed,
+        }
+
+
+live_counter = LiveCounter(settings.live_counter_interval_seconds)
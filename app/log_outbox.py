@@ -0,0 +1,205 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.keyboards import digest_exclude_kb, entry_admin_kb
+from app.models import ChannelLog
+from app.outbound import outbound_priority
+from app.ratelimit import TokenBucket
+from app.texts import LOG_ENTRY_NEW
+
+log = logging.getLogger(__name__)
+
+# سطر وزر استبعاد لكل مشاركة في الملخّص؛ الباقي يبقى في الطابور للرسالة التالية.
+# 50 زرًا تحت حد تيليجرام (100) و50 سطرًا تحت حد طول الرسالة
+DIGEST_MAX_LINES = 50
+LOG_CHAT_CACHE_MAX = 10_000
+
+
+@dataclass
+class LogItem:
+    user_id: int
+    username: Optional[str]
+    entry_id: int
+    seq_no: int
+    ts: int
+
+
+def _user_line(item: LogItem) -> str:
+    return ("@" + item.username) if item.username else "بدون يوزر"
+
+
+def entry_text(item: LogItem) -> str:
+    return (
+        f"{LOG_ENTRY_NEW}\n"
+        f"{_user_line(item)}\n"
+        f"{item.user_id}\n"
+        f"{item.ts}\n"
+        f"عدد المشاركين: {item.seq_no}"
+    )
+
+
+def digest_text(items: List[LogItem]) -> str:
+    lines = [f"{len(items)} مشاركة جديدة:"]
+    for item in items:
+        lines.append(f"#{item.seq_no} {_user_line(item)} ({item.user_id})")
+    lines.append(f"عدد المشاركين: {items[-1].seq_no}")
+    return "\n".join(lines)
+
+
+def lost_text(count: int) -> str:
+    return f"⚠️ {count} مشاركة لم تُعرض في السجل بسبب الضغط؛ استخدم /export لقائمة كاملة."
+
+
+class ChannelLogOutbox:
+    # إشعارات سجل القناة تُرسل في الخلفية بحد لكل محادثة؛ إذا تأخرت المحادثة
+    # تُدمج الرسائل المتراكمة في ملخّصات من DIGEST_MAX_LINES مشاركة مع زر استبعاد لكل منها.
+    # ما يتجاوز max_pending يُحذف من الأقدم ويُبلَّغ بعدده في رسالة السجل التالية
+    def __init__(self, per_minute: float, digest_after: int, max_pending: int):
+        self.rate = max(per_minute, 1) / 60
+        self.digest_after = max(1, digest_after)
+        self.max_pending = max(1, max_pending)
+        self.bot: Optional[Bot] = None
+        self._queues: Dict[int, Deque[LogItem]] = {}
+        self._buckets: Dict[int, TokenBucket] = {}
+        self._lost: Dict[int, int] = {}
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self.sent = 0
+        self.digests = 0
+        self.failed = 0
+        self.dropped = 0
+
+    def start(self, bot: Bot) -> None:
+        self.bot = bot
+
+    def enqueue(self, log_chat_id: int, item: LogItem) -> None:
+        q = self._queues.setdefault(log_chat_id, deque())
+        if len(q) >= self.max_pending:
+            q.popleft()
+            self.dropped += 1
+            lost = self._lost.get(log_chat_id, 0)
+            if not lost:
+                log.warning("Channel log %s is backed up; dropping oldest pending entries", log_chat_id)
+            self._lost[log_chat_id] = lost + 1
+        q.append(item)
+        if self.bot is not None and log_chat_id not in self._tasks:
+            self._tasks[log_chat_id] = asyncio.create_task(self._drain(log_chat_id))
+
+    async def _send(self, chat_id: int, items: List[LogItem]) -> None:
+        lost = self._lost.pop(chat_id, 0)
+        note = f"\n\n{lost_text(lost)}" if lost else ""
+        try:
+            if len(items) == 1:
+                item = items[0]
+                await self.bot.send_message(
+                    chat_id=chat_id,
+                    text=entry_text(item) + note,
+                    reply_markup=entry_admin_kb(item.user_id, item.entry_id),
+                )
+            else:
+                await self.bot.send_message(
+                    chat_id=chat_id,
+                    text=digest_text(items) + note,
+                    reply_markup=digest_exclude_kb([(i.seq_no, i.entry_id) for i in items]),
+                )
+                self.digests += 1
+        except BaseException:
+            if lost:
+                self._lost[chat_id] = self._lost.get(chat_id, 0) + lost
+            raise
+
+    async def _drain(self, chat_id: int) -> None:
+        with outbound_priority("log"):
+            await self._drain_queue(chat_id)
+
+    async def _drain_queue(self, chat_id: int) -> None:
+        q = self._queues[chat_id]
+        bucket = self._buckets.setdefault(chat_id, TokenBucket(self.rate))
+        try:
+            while q:
+                await bucket.acquire()
+                if len(q) > self.digest_after:
+                    items = [q.popleft() for _ in range(min(len(q), DIGEST_MAX_LINES))]
+                else:
+                    items = [q.popleft()]
+                try:
+                    await self._send(chat_id, items)
+                    self.sent += len(items)
+                except TelegramRetryAfter as e:
+                    bucket.pause(e.retry_after)
+                    q.extendleft(reversed(items))
+                except Exception:
+                    self.failed += len(items)
+                    log.warning("Channel log delivery to %s failed", chat_id, exc_info=True)
+        finally:
+            self._tasks.pop(chat_id, None)
+            if not q:
+                self._queues.pop(chat_id, None)
+            self._prune_buckets()
+
+    def _prune_buckets(self) -> None:
+        for chat_id in [c for c, b in self._buckets.items() if c not in self._queues and b.is_idle()]:
+            del self._buckets[chat_id]
+
+    async def stop(self, timeout: float = 5.0) -> None:
+        tasks = list(self._tasks.values())
+        if not tasks:
+            return
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        for t in pending:
+            t.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "chats_pending": len(self._queues),
+            "pending": sum(len(q) for q in self._queues.values()),
+            "sent": self.sent,
+            "digests": self.digests,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "buckets": len(self._buckets),
+            "log_chat_cache": len(_log_chat_cache),
+        }
+
+
+channel_log_outbox = ChannelLogOutbox(
+    settings.channel_log_per_minute,
+    settings.channel_log_digest_after,
+    settings.channel_log_max_pending,
+)
+
+# مرتبة حسب وقت الانتهاء (نفس TTL للجميع)، فالمنتهي دائمًا في المقدمة
+_log_chat_cache: OrderedDict[int, Tuple[Optional[int], float]] = OrderedDict()
+
+
+async def get_log_chat_id(session: AsyncSession, source_chat_id: int) -> Optional[int]:
+    # يُخزَّن الغياب أيضًا، فمعظم القنوات بلا سجل ولا داعي لسؤال القاعدة مع كل ضغطة
+    cached = _log_chat_cache.get(source_chat_id)
+    now = time.monotonic()
+    if cached and cached[1] > now:
+        return cached[0]
+    chlog = await session.get(ChannelLog, source_chat_id)
+    log_chat_id = chlog.log_chat_id if chlog else None
+    _log_chat_cache[source_chat_id] = (log_chat_id, now + settings.channel_log_cache_seconds)
+    _log_chat_cache.move_to_end(source_chat_id)
+    while _log_chat_cache:
+        _, (_, expires_at) = next(iter(_log_chat_cache.items()))
+        if expires_at > now and len(_log_chat_cache) <= LOG_CHAT_CACHE_MAX:
+            break
+        _log_chat_cache.popitem(last=False)
+    return log_chat_id
+
+
+def invalidate_log_chat(source_chat_id: int) -> None:
+    _log_chat_cache.pop(source_chat_id, None)
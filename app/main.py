@@ -1,34 +1,160 @@
+from __future__ import annotations
+
+import logging
 from fastapi import FastAPI, Request, HTTPException
+
 from aiogram.types import Update
 
 from app.bot import bot, dp
 from app.config import settings
-from app.db import connect_db, close_db
+from app.db import engine, Base, AsyncSessionLocal
+from app.migrations import run_migrations
+from app.scheduler import (
+    scheduler, check_mandatory_membership_job, auto_draw_job, membership_cache_cleanup_job,
+    reconcile_membership_job, throttle_cleanup_job, refresh_mandatory_channels_job, fsm_cleanup_job,
+    shard_worker_job, notify_resume_job, broadcast_worker_job,
+)
+from app.membership import membership_cache
+from app.audit import audit_buffer
+from app.log_outbox import channel_log_outbox
+from app.outbound import outbound_scheduler
+from app.channels import mandatory_channels
+from app.user_cache import user_state_cache
+from app.fsm_storage import DbStorage
+from app.leader import leader
+from app.live_counter import live_counter
+from app.shards import shard_stats
+from app.update_queue import UpdateQueue, QueueFull
+from app.middlewares import DbSessionMiddleware, ThrottleMiddleware
+from app.throttle import click_throttle
+
+from app.handlers import (
+    start_gate, menu, giveaway_create, participate, channel_log, stats, donate_stars, terms_privacy, admin, entry_actions,
+    membership_events, export,
+)
+
+logging.basicConfig(level=logging.INFO)
+
+db_session_middleware = DbSessionMiddleware(AsyncSessionLocal)
+dp.update.outer_middleware(db_session_middleware)
+dp.callback_query.outer_middleware(ThrottleMiddleware(click_throttle, settings.throttle_prefixes_list))
+
+dp.include_router(start_gate.router)
+dp.include_router(menu.router)
+dp.include_router(giveaway_create.router)
+dp.include_router(participate.router)
+dp.include_router(channel_log.router)
+dp.include_router(stats.router)
+dp.include_router(donate_stars.router)
+dp.include_router(terms_privacy.router)
+dp.include_router(admin.router)
+dp.include_router(entry_actions.router)
+dp.include_router(membership_events.router)
+dp.include_router(export.router)
+
+update_queue = UpdateQueue(
+    bot,
+    dp,
+    maxsize=settings.webhook_queue_size,
+    workers=settings.webhook_workers,
+    overflow=settings.webhook_queue_overflow,
+)
 
 app = FastAPI()
 
 
 @app.on_event("startup")
 async def on_startup():
-    await connect_db()
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    await run_migrations(engine)
+    await audit_buffer.start()
+    await user_state_cache.start()
+    channel_log_outbox.start(bot)
+    live_counter.start(bot)
 
-    webhook_url = f"{settings.BASE_URL}/webhook/{settings.WEBHOOK_SECRET}"
-    await bot.set_webhook(webhook_url, drop_pending_updates=True)
+    if settings.webhook_queue_enabled:
+        await update_queue.start()
+
+    await mandatory_channels.refresh(bot)
+    await membership_cache.load_tracked()
+    await membership_events.track_mandatory_channels(bot)
+
+    webhook_url = f"{settings.base_url}/webhook/{settings.webhook_secret}"
+    # chat_member لا يُرسل افتراضيًا، لذلك نطلب كل الأنواع التي تستخدمها المعالجات صراحة
+    await bot.set_webhook(
+        webhook_url,
+        drop_pending_updates=True,
+        allowed_updates=dp.resolve_used_update_types(),
+    )
+
+    scheduler.add_job(check_mandatory_membership_job, "interval", hours=settings.check_membership_every_hours, args=[bot])
+    scheduler.add_job(auto_draw_job, "interval", seconds=settings.auto_draw_scan_seconds, args=[bot])
+    scheduler.add_job(membership_cache_cleanup_job, "interval", minutes=30)
+    scheduler.add_job(reconcile_membership_job, "interval", minutes=10, args=[bot])
+    scheduler.add_job(throttle_cleanup_job, "interval", minutes=10)
+    scheduler.add_job(notify_resume_job, "interval", minutes=1, args=[bot])
+    scheduler.add_job(shard_worker_job, "interval", seconds=settings.shard_poll_seconds, args=[bot])
+    scheduler.add_job(broadcast_worker_job, "interval", seconds=settings.shard_poll_seconds, args=[bot])
+    scheduler.add_job(fsm_cleanup_job, "interval", hours=1, args=[dp.storage])
+    scheduler.add_job(refresh_mandatory_channels_job, "interval", minutes=settings.mandatory_channels_refresh_minutes, args=[bot])
+    if settings.leader_election_enabled:
+        await leader.start()
+    scheduler.start()
+    logging.info("Startup complete.")
 
 
 @app.on_event("shutdown")
 async def on_shutdown():
-    await bot.delete_webhook()
-    await close_db()
+    scheduler.shutdown(wait=False)
+    await leader.stop()
+    await bot.delete_webhook(drop_pending_updates=True)
+    if settings.webhook_queue_enabled:
+        await update_queue.stop()
+    await audit_buffer.stop()
+    await user_state_cache.stop()
+    await channel_log_outbox.stop()
+    await live_counter.stop()
+    await dp.storage.close()
     await bot.session.close()
 
 
 @app.post("/webhook/{secret}")
 async def webhook(secret: str, request: Request):
-    if secret != settings.WEBHOOK_SECRET:
-        raise HTTPException(status_code=403)
+    if secret != settings.webhook_secret:
+        raise HTTPException(status_code=403, detail="Forbidden")
 
     data = await request.json()
-    update = Update.model_validate(data)
+    update = Update.model_validate(data, context={"bot": bot})
+
+    if settings.webhook_queue_enabled:
+        try:
+            await update_queue.put(update)
+        except QueueFull:
+            # تيليجرام يعيد إرسال التحديث لاحقًا عند أي رد غير 2xx
+            raise HTTPException(status_code=503, detail="Busy")
+        return {"ok": True}
+
     await dp.feed_update(bot, update)
     return {"ok": True}
+
+
+@app.get("/stats/{secret}")
+async def runtime_stats(secret: str):
+    if secret != settings.webhook_secret:
+        raise HTTPException(status_code=403, detail="Forbidden")
+    return {
+        "queue": update_queue.stats() if settings.webhook_queue_enabled else None,
+        "db_sessions": db_session_middleware.stats(),
+        "membership_cache": await membership_cache.stats(),
+        "audit_buffer": audit_buffer.stats(),
+        "click_throttle": await click_throttle.stats(),
+        "channel_log_outbox": channel_log_outbox.stats(),
+        "outbound": outbound_scheduler.stats(),
+        "mandatory_channels": mandatory_channels.stats(),
+        "user_cache": user_state_cache.stats(),
+        "live_counter": live_counter.stats(),
+        "leader": await leader.status(),
+        "shards": await shard_stats(),
+        "fsm_storage": dp.storage.stats() if isinstance(dp.storage, DbStorage) else None,
+    }
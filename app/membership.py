@@ -0,0 +1,232 @@
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from aiogram import Bot
+from sqlalchemy import delete, or_, select, func
+from sqlalchemy.dialects.postgresql import insert
+
+from app.config import settings
+from app.db import AsyncSessionLocal
+from app.models import ChatMember, TrackedChat
+from app.ratelimit import TokenBucket
+
+NEGATIVE_STATUSES = ("left", "kicked")
+
+
+class MemoryMembershipBackend:
+    name = "memory"
+
+    def __init__(self, maxsize: int):
+        self.maxsize = max(1, maxsize)
+        self._data: OrderedDict[Tuple[int, int], Tuple[str, float]] = OrderedDict()
+
+    async def get(self, chat_id: int, user_id: int) -> Optional[str]:
+        key = (chat_id, user_id)
+        item = self._data.get(key)
+        if item is None:
+            return None
+        status, expires_at = item
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return status
+
+    async def set(self, chat_id: int, user_id: int, status: str, ttl: Optional[float]) -> None:
+        key = (chat_id, user_id)
+        expires_at = time.monotonic() + ttl if ttl is not None else float("inf")
+        self._data[key] = (status, expires_at)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    async def delete(self, chat_id: int, user_id: int) -> None:
+        self._data.pop((chat_id, user_id), None)
+
+    async def delete_chat(self, chat_id: int) -> None:
+        for key in [k for k in self._data if k[0] == chat_id]:
+            del self._data[key]
+
+    async def cleanup_expired(self) -> int:
+        now = time.monotonic()
+        expired = [k for k, (_, exp) in self._data.items() if exp <= now]
+        for key in expired:
+            del self._data[key]
+        return len(expired)
+
+    async def size(self) -> int:
+        return len(self._data)
+
+
+class DbMembershipBackend:
+    # مشترك بين كل العمليات عبر جدول chat_members
+    name = "db"
+
+    async def get(self, chat_id: int, user_id: int) -> Optional[str]:
+        async with AsyncSessionLocal() as session:
+            return (await session.execute(
+                select(ChatMember.status).where(
+                    ChatMember.chat_id == chat_id,
+                    ChatMember.user_id == user_id,
+                    or_(ChatMember.expires_at.is_(None), ChatMember.expires_at > func.now()),
+                )
+            )).scalar_one_or_none()
+
+    async def set(self, chat_id: int, user_id: int, status: str, ttl: Optional[float]) -> None:
+        expires_at = datetime.now(timezone.utc) + timedelta(seconds=ttl) if ttl is not None else None
+        stmt = insert(ChatMember).values(chat_id=chat_id, user_id=user_id, status=status, expires_at=expires_at)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[ChatMember.chat_id, ChatMember.user_id],
+            set_={"status": status, "expires_at": expires_at, "updated_at": func.now()},
+        )
+        async with AsyncSessionLocal() as session:
+            await session.execute(stmt)
+            await session.commit()
+
+    async def delete(self, chat_id: int, user_id: int) -> None:
+        async with AsyncSessionLocal() as session:
+            await session.execute(delete(ChatMember).where(ChatMember.chat_id == chat_id, ChatMember.user_id == user_id))
+            await session.commit()
+
+    async def delete_chat(self, chat_id: int) -> None:
+        async with AsyncSessionLocal() as session:
+            await session.execute(delete(ChatMember).where(ChatMember.chat_id == chat_id))
+            await session.commit()
+
+    async def cleanup_expired(self) -> int:
+        async with AsyncSessionLocal() as session:
+            res = await session.execute(delete(ChatMember).where(ChatMember.expires_at <= func.now()))
+            await session.commit()
+            return res.rowcount or 0
+
+    async def size(self) -> int:
+        async with AsyncSessionLocal() as session:
+            return (await session.execute(select(func.count()).select_from(ChatMember))).scalar_one()
+
+    async def stale(self, older_than: timedelta, limit: int) -> List[Tuple[int, int]]:
+        # صفوف الأحداث (بدون انتهاء) التي لم تتحدث منذ مدة، قد نكون فوّتنا حدثًا أثناء التوقف
+        async with AsyncSessionLocal() as session:
+            rows = (await session.execute(
+                select(ChatMember.chat_id, ChatMember.user_id)
+                .where(ChatMember.expires_at.is_(None), ChatMember.updated_at < func.now() - older_than)
+                .order_by(ChatMember.updated_at.asc())
+                .limit(limit)
+            )).all()
+        return [(r.chat_id, r.user_id) for r in rows]
+
+
+class MembershipCache:
+    # القنوات "المتتبَّعة" هي التي البوت مشرف فيها ويستلم تحديثات chat_member منها.
+    # حالتها في جدول chat_members دائمة (بدون انتهاء) لأن أي تغيير لاحق يصلنا كحدث.
+    def __init__(self, backend, ttl_member: float, ttl_left: float):
+        self.backend = backend
+        self.table = backend if isinstance(backend, DbMembershipBackend) else DbMembershipBackend()
+        self.ttl_member = ttl_member
+        self.ttl_left = ttl_left
+        self.tracked_chats: Set[int] = set()
+        self.hits = 0
+        self.misses = 0
+        self.api_calls = 0
+
+    def _ttl(self, status: str) -> float:
+        return self.ttl_left if status in NEGATIVE_STATUSES else self.ttl_member
+
+    def is_tracked(self, chat_id: int) -> bool:
+        return chat_id in self.tracked_chats
+
+    async def load_tracked(self) -> None:
+        async with AsyncSessionLocal() as session:
+            self.tracked_chats = set((await session.execute(select(TrackedChat.chat_id))).scalars().all())
+
+    async def track_chat(self, chat_id: int) -> None:
+        if chat_id in self.tracked_chats:
+            return
+        self.tracked_chats.add(chat_id)
+        async with AsyncSessionLocal() as session:
+            await session.execute(insert(TrackedChat).values(chat_id=chat_id).on_conflict_do_nothing())
+            await session.commit()
+
+    async def untrack_chat(self, chat_id: int) -> None:
+        self.tracked_chats.discard(chat_id)
+        async with AsyncSessionLocal() as session:
+            await session.execute(delete(TrackedChat).where(TrackedChat.chat_id == chat_id))
+            await session.commit()
+        await self.table.delete_chat(chat_id)
+        if self.table is not self.backend:
+            await self.backend.delete_chat(chat_id)
+
+    async def get_status(
+        self, bot: Bot, chat_id: int, user_id: int, fresh: bool = False, limiter: Optional[TokenBucket] = None
+    ) -> str:
+        # أخطاء API لا تُخزَّن، ويقرر المستدعي ماذا يفعل بها
+        tracked = chat_id in self.tracked_chats
+        if not fresh:
+            status = await self.backend.get(chat_id, user_id)
+            if status is None and tracked and self.table is not self.backend:
+                status = await self.table.get(chat_id, user_id)
+                if status is not None:
+                    await self.backend.set(chat_id, user_id, status, self._ttl(status))
+            if status is not None:
+                self.hits += 1
+                return status
+        self.misses += 1
+        self.api_calls += 1
+        if limiter is not None:
+            cm = await limiter.call(bot.get_chat_member, chat_id, user_id)
+        else:
+            cm = await bot.get_chat_member(chat_id, user_id)
+        await self.store(chat_id, user_id, cm.status, permanent=tracked)
+        return cm.status
+
+    async def is_member(
+        self, bot: Bot, chat_id: int, user_id: int, fresh: bool = False, limiter: Optional[TokenBucket] = None
+    ) -> bool:
+        return await self.get_status(bot, chat_id, user_id, fresh=fresh, limiter=limiter) not in NEGATIVE_STATUSES
+
+    async def store(self, chat_id: int, user_id: int, status: str, permanent: bool = False) -> None:
+        if permanent:
+            await self.table.set(chat_id, user_id, status, None)
+            if self.table is self.backend:
+                return
+        await self.backend.set(chat_id, user_id, status, self._ttl(status))
+
+    async def invalidate(self, chat_id: int, user_id: Optional[int] = None) -> None:
+        if user_id is None:
+            await self.backend.delete_chat(chat_id)
+        else:
+            await self.backend.delete(chat_id, user_id)
+
+    async def cleanup_expired(self) -> int:
+        return await self.backend.cleanup_expired()
+
+    async def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "backend": self.backend.name,
+            "size": await self.backend.size(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+            "api_calls": self.api_calls,
+            "tracked_chats": len(self.tracked_chats),
+        }
+
+
+def _make_backend():
+    if settings.membership_cache_backend == "db":
+        return DbMembershipBackend()
+    return MemoryMembershipBackend(settings.membership_cache_size)
+
+
+membership_cache = MembershipCache(
+    _make_backend(),
+    ttl_member=settings.membership_cache_ttl_member,
+    ttl_left=settings.membership_cache_ttl_left,
+)
+
+# مشترك بين فحص العضوية الدوري وإعادة التحقق عند السحب
+membership_limiter = TokenBucket(settings.membership_check_rate)
@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, TelegramObject
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.throttle import Throttle
+
+
+class _HoldTimer:
+    __slots__ = ("started", "held")
+
+    def __init__(self):
+        self.started: Optional[float] = None
+        self.held = 0.0
+
+    def begin(self, *_):
+        if self.started is None:
+            self.started = time.monotonic()
+
+    def end(self, session, transaction):
+        if transaction.parent is None and self.started is not None:
+            self.held += time.monotonic() - self.started
+            self.started = None
+
+
+class DbSessionMiddleware(BaseMiddleware):
+    # جلسة مستقلة لكل تحديث. AsyncSession لا يسحب اتصالًا من الـ pool إلا عند أول استعلام،
+    # لذلك معالجات القائمة/الشروط التي لا تلمس قاعدة البيانات لا تحجز اتصالًا.
+    def __init__(self, session_factory: async_sessionmaker[AsyncSession]):
+        self.session_factory = session_factory
+        self.updates = 0
+        self.db_updates = 0
+        self.active = 0
+        self.hold_total = 0.0
+        self.hold_max = 0.0
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event_: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        timer = _HoldTimer()
+        self.updates += 1
+        self.active += 1
+        try:
+            async with self.session_factory() as session:
+                event.listen(session.sync_session, "after_begin", timer.begin)
+                event.listen(session.sync_session, "after_transaction_end", timer.end)
+                data["session"] = session
+                return await handler(event_, data)
+        finally:
+            self.active -= 1
+            if timer.started is not None:
+                timer.held += time.monotonic() - timer.started
+            if timer.held:
+                self.db_updates += 1
+                self.hold_total += timer.held
+                self.hold_max = max(self.hold_max, timer.held)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "updates": self.updates,
+            "updates_with_db": self.db_updates,
+            "active_sessions": self.active,
+            "avg_hold_ms": round(1000 * self.hold_total / self.db_updates, 2) if self.db_updates else 0.0,
+            "max_hold_ms": round(1000 * self.hold_max, 2),
+        }
+
+
+class ThrottleMiddleware(BaseMiddleware):
+    # يُسجَّل على dp.callback_query ويطبَّق على أي بادئة callback_data
+    def __init__(self, throttle: Throttle, prefixes: Iterable[str], message: str = "تمهل قليلًا."):
+        self.throttle = throttle
+        self.prefixes = tuple(prefixes)
+        self.message = message
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event_: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        if isinstance(event_, CallbackQuery) and event_.data and event_.data.startswith(self.prefixes):
+            if not await self.throttle.hit(f"{event_.from_user.id}:{event_.data}"):
+                await event_.answer(self.message, show_alert=False)
+                return None
+        return await handler(event_, data)
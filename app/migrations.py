@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+# create_all لا يعدّل الجداول الموجودة، فنضيف هنا ما استُحدث عليها لاحقًا.
+# كل أمر يجب أن يكون آمنًا للتكرار عند كل تشغيل.
+STATEMENTS = [
+    "CREATE INDEX IF NOT EXISTS ix_entries_giveaway_seq ON entries (giveaway_id, seq_no)",
+    "CREATE INDEX IF NOT EXISTS ix_entries_user_giveaway ON entries (user_id, giveaway_id)",
+    "ALTER TABLE giveaways ADD COLUMN IF NOT EXISTS entries_count INTEGER NOT NULL DEFAULT 0",
+    "ALTER TABLE giveaways ADD COLUMN IF NOT EXISTS excluded_count INTEGER NOT NULL DEFAULT 0",
+    # السحوبات المسحوبة والفائزون السابقون يأخذون 'legacy' حتى لا يُرسل لهم إعلان بعد النشر؛ الجديد يبدأ 'pending'
+    "ALTER TABLE giveaways ADD COLUMN IF NOT EXISTS announce_status VARCHAR(16) NOT NULL DEFAULT 'legacy'",
+    "ALTER TABLE giveaways ALTER COLUMN announce_status SET DEFAULT 'pending'",
+    "ALTER TABLE giveaways ADD COLUMN IF NOT EXISTS announced_at TIMESTAMP WITH TIME ZONE",
+    # 'legacy' للسحوبات المسحوبة فقط؛ ما لم يُسحب وقت النشر يجب أن يُعلن عند سحبه
+    "UPDATE giveaways SET announce_status = 'pending' WHERE announce_status = 'legacy' AND is_drawn = false",
+    "ALTER TABLE winners ADD COLUMN IF NOT EXISTS notify_status VARCHAR(16) NOT NULL DEFAULT 'legacy'",
+    "ALTER TABLE winners ALTER COLUMN notify_status SET DEFAULT 'pending'",
+    "ALTER TABLE winners ADD COLUMN IF NOT EXISTS notified_at TIMESTAMP WITH TIME ZONE",
+    "ALTER TABLE giveaways ADD COLUMN IF NOT EXISTS counter_shown INTEGER",
+    "ALTER TABLE giveaways ADD COLUMN IF NOT EXISTS counter_edited_at TIMESTAMP WITH TIME ZONE",
+    # تعبئة العدادات للسحوبات التي سبقت إضافتها (يستمر seq_no بعد أكبر رقم موجود)
+    """
+    UPDATE giveaways g SET entries_count = (SELECT COALESCE(MAX(e.seq_no), 0) FROM entries e WHERE e.giveaway_id = g.id)
+    WHERE g.entries_count = 0 AND EXISTS (SELECT 1 FROM entries e WHERE e.giveaway_id = g.id)
+    """,
+    """
+    UPDATE giveaways g SET excluded_count = (SELECT COUNT(*) FROM entries e WHERE e.giveaway_id = g.id AND e.excluded)
+    WHERE g.excluded_count = 0 AND EXISTS (SELECT 1 FROM entries e WHERE e.giveaway_id = g.id AND e.excluded)
+    """,
+]
+
+
+async def run_migrations(engine: AsyncEngine) -> None:
+    async with engine.begin() as conn:
+        for stmt in STATEMENTS:
+            await conn.execute(text(stmt))
@@ -1,9 +1,10 @@
 from __future__ import annotations
 
 from sqlalchemy import (
-    BigInteger, Boolean, DateTime, ForeignKey, Integer, String, Text,
+    BigInteger, Boolean, DateTime, ForeignKey, Index, Integer, String, Text,
     UniqueConstraint, func
 )
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from app.db import Base
 
@@ -33,6 +34,69 @@ class Chat(Base):
     created_at: Mapped[str] = mapped_column(DateTime(timezone=True), server_default=func.now())
 
 
+class ChatMember(Base):
+    __tablename__ = "chat_members"
+    chat_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    user_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    status: Mapped[str] = mapped_column(String(16))
+    expires_at: Mapped[str | None] = mapped_column(DateTime(timezone=True), nullable=True, index=True)
+    updated_at: Mapped[str] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class TrackedChat(Base):
+    __tablename__ = "tracked_chats"
+    chat_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    created_at: Mapped[str] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+
+class JobShard(Base):
+    # جزء من مهمة دورية يأخذه أي عامل (FOR UPDATE SKIP LOCKED) بعقد إيجار يُجدَّد أثناء العمل
+    __tablename__ = "job_shards"
+    job: Mapped[str] = mapped_column(String(64), primary_key=True)
+    shard: Mapped[int] = mapped_column(Integer, primary_key=True)
+    shard_count: Mapped[int] = mapped_column(Integer)
+    generation: Mapped[int] = mapped_column(Integer, default=1)
+    range_start: Mapped[int] = mapped_column(BigInteger, default=0)
+    range_end: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
+    cursor: Mapped[int] = mapped_column(BigInteger, default=0)
+    done: Mapped[bool] = mapped_column(Boolean, default=False)
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    lease_owner: Mapped[str | None] = mapped_column(String(128), nullable=True)
+    lease_until: Mapped[str | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    updated_at: Mapped[str] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class BroadcastCampaign(Base):
+    # رسالة جماعية من الأدمن؛ موضع التقدم في job_shards (المهمة broadcast:<id>) والعدادات هنا
+    __tablename__ = "broadcasts"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    created_by: Mapped[int] = mapped_column(BigInteger)
+    text: Mapped[str] = mapped_column(Text)
+    # pending → running → done | cancelled | failed
+    status: Mapped[str] = mapped_column(String(16), default="pending", index=True)
+    total: Mapped[int] = mapped_column(Integer, default=0)
+    sent: Mapped[int] = mapped_column(Integer, default=0)
+    failed: Mapped[int] = mapped_column(Integer, default=0)
+    blocked: Mapped[int] = mapped_column(Integer, default=0)
+    created_at: Mapped[str] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    started_at: Mapped[str | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    finished_at: Mapped[str | None] = mapped_column(DateTime(timezone=True), nullable=True)
+
+
+class FsmState(Base):
+    __tablename__ = "fsm_states"
+    key: Mapped[str] = mapped_column(String(128), primary_key=True)
+    state: Mapped[str | None] = mapped_column(String(128), nullable=True)
+    data: Mapped[dict] = mapped_column(JSONB, default=dict)
+    updated_at: Mapped[str] = mapped_column(DateTime(timezone=True), server_default=func.now(), index=True)
+
+
+class ClickThrottle(Base):
+    __tablename__ = "click_throttle"
+    key: Mapped[str] = mapped_column(String(128), primary_key=True)
+    hit_at: Mapped[str] = mapped_column(DateTime(timezone=True), index=True)
+
+
 class ChannelLog(Base):
     __tablename__ = "channel_logs"
     source_chat_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
@@ -63,17 +127,29 @@ class Giveaway(Base):
     auto_draw_entries_threshold: Mapped[int | None] = mapped_column(Integer, nullable=True)
 
     published_message_id: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    entries_count: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    excluded_count: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    # آخر عدد ظهر على زر المنشور ووقت تعديله؛ مشتركان بين العمال حتى لا يعدّل كل عامل المنشور نفسه
+    counter_shown: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    counter_edited_at: Mapped[str | None] = mapped_column(DateTime(timezone=True), nullable=True)
     is_drawn: Mapped[bool] = mapped_column(Boolean, default=False)
 
     paid_comment_condition_enabled: Mapped[bool] = mapped_column(Boolean, default=False)
 
     created_at: Mapped[str] = mapped_column(DateTime(timezone=True), server_default=func.now())
     drawn_at: Mapped[str | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    # pending → sending → sent | failed
+    announce_status: Mapped[str] = mapped_column(String(16), default="pending", server_default="pending")
+    announced_at: Mapped[str | None] = mapped_column(DateTime(timezone=True), nullable=True)
 
 
 class Entry(Base):
     __tablename__ = "entries"
-    __table_args__ = (UniqueConstraint("giveaway_id", "user_id", name="uq_entry_giveaway_user"),)
+    __table_args__ = (
+        UniqueConstraint("giveaway_id", "user_id", name="uq_entry_giveaway_user"),
+        Index("ix_entries_giveaway_seq", "giveaway_id", "seq_no"),
+        Index("ix_entries_user_giveaway", "user_id", "giveaway_id"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     giveaway_id: Mapped[int] = mapped_column(ForeignKey("giveaways.id"), index=True)
@@ -95,6 +171,9 @@ class Winner(Base):
     giveaway_id: Mapped[int] = mapped_column(ForeignKey("giveaways.id"), index=True)
     user_id: Mapped[int] = mapped_column(BigInteger, index=True)
     username: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    # pending → sending → sent | skipped (لم يفعّل الإشعار) | blocked | failed
+    notify_status: Mapped[str] = mapped_column(String(16), default="pending", server_default="pending")
+    notified_at: Mapped[str | None] = mapped_column(DateTime(timezone=True), nullable=True)
     created_at: Mapped[str] = mapped_column(DateTime(timezone=True), server_default=func.now())
 
 
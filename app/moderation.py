@@ -0,0 +1,175 @@
+from __future__ import annotations
+
+import csv
+import json
+import re
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import BigInteger, any_, exists, func, insert, literal, select, update
+from sqlalchemy.dialects.postgresql import ARRAY, insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import AuditLog, Chat, Entry, Giveaway, User
+
+_ID_RE = re.compile(r"-?\d+")
+_SEP_RE = re.compile(r"[\s,]+")
+
+
+def _as_id(value: Any) -> Optional[int]:
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if isinstance(value, str) and _ID_RE.fullmatch(value.strip()):
+        return int(value.strip())
+    return None
+
+
+def parse_id_list(text: str) -> Tuple[List[int], int]:
+    # معرّفات مفصولة بمسافات أو فواصل؛ كل جزء يجب أن يكون رقمًا كاملًا، وإلا يُعد مرفوضًا
+    ids: List[int] = []
+    bad = 0
+    for token in _SEP_RE.split(text or ""):
+        if not token:
+            continue
+        value = _as_id(token)
+        if value is None:
+            bad += 1
+        else:
+            ids.append(value)
+    return list(dict.fromkeys(ids)), bad
+
+
+def parse_id_file(text: str, column: str) -> Tuple[List[int], int]:
+    # معرّف واحد لكل سطر: أول حقل CSV، أو عمود column إذا كان للملف ترويسة (مثل ملف /export)،
+    # أو المفتاح column في أسطر JSONL. لا نلتقط أرقامًا من داخل الحقول
+    ids: List[int] = []
+    bad = 0
+    idx = 0
+    first = True
+    for line in (text or "").splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith("{"):
+            try:
+                value = _as_id(json.loads(line).get(column))
+            except (ValueError, AttributeError):
+                value = None
+        else:
+            row = next(csv.reader([line]))
+            cells = [c.strip().lower() for c in row]
+            if first and column in cells and _as_id(row[0]) is None:
+                idx = cells.index(column)
+                first = False
+                continue
+            value = _as_id(row[idx]) if idx < len(row) else None
+        first = False
+        if value is None:
+            bad += 1
+        else:
+            ids.append(value)
+    return list(dict.fromkeys(ids)), bad
+
+
+def _id_array(ids: Sequence[int]):
+    # مصفوفة كمعامل واحد: IN (...) بآلاف المعرّفات يتجاوز حد معاملات asyncpg
+    return any_(literal(list(ids), ARRAY(BigInteger)))
+
+
+async def _audit_many(session: AsyncSession, actor: int, action: str, entity: str, ids: Sequence[int], detail: Optional[str]) -> None:
+    if ids:
+        await session.execute(insert(AuditLog), [
+            {"actor_user_id": actor, "action": action, "entity": entity, "entity_id": str(i), "detail": detail}
+            for i in ids
+        ])
+
+
+def _ban_users_where(ids: Sequence[int]):
+    return (User.id == _id_array(ids), User.is_banned == False)
+
+
+async def count_ban_users(session: AsyncSession, ids: Sequence[int]) -> int:
+    return (await session.execute(select(func.count()).select_from(User).where(*_ban_users_where(ids)))).scalar_one()
+
+
+async def ban_users(session: AsyncSession, actor: int, ids: Sequence[int]) -> List[int]:
+    # يعيد المعرّفات التي تغيّرت؛ المستدعي يُبطل user_state_cache بعد commit
+    changed = (await session.execute(
+        update(User).where(*_ban_users_where(ids)).values(is_banned=True).returning(User.id)
+    )).scalars().all()
+    await _audit_many(session, actor, "ban_user", "user", changed, "bulk")
+    return list(changed)
+
+
+async def count_ban_chats(session: AsyncSession, ids: Sequence[int]) -> int:
+    already = (await session.execute(
+        select(func.count()).select_from(Chat).where(Chat.id == _id_array(ids), Chat.is_banned == True)
+    )).scalar_one()
+    return len(ids) - already
+
+
+async def ban_chats(session: AsyncSession, actor: int, ids: Sequence[int]) -> int:
+    # القنوات التي لم يرها البوت بعد تُضاف محظورة مباشرة، كما في /ban_chat
+    stmt = pg_insert(Chat).from_select(
+        ["id", "type", "is_banned"],
+        select(func.unnest(literal(list(ids), ARRAY(BigInteger))), literal("unknown"), literal(True)),
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Chat.id], set_={"is_banned": True}, where=Chat.is_banned == False,
+    ).returning(Chat.id)
+    changed = (await session.execute(stmt)).scalars().all()
+    await _audit_many(session, actor, "ban_chat", "chat", changed, "bulk")
+    return len(changed)
+
+
+@dataclass
+class EntryFilter:
+    giveaway_id: int
+    entry_ids: List[int] = field(default_factory=list)
+    user_ids: List[int] = field(default_factory=list)
+    # User.created_at: أول مرة رأى فيها البوت الحساب، وهو أقرب ما لدينا لعمر الحساب
+    users_after: Optional[datetime] = None
+    entered_after: Optional[datetime] = None
+
+    def where(self) -> List[Any]:
+        out: List[Any] = [Entry.giveaway_id == self.giveaway_id, Entry.excluded == False]
+        if self.entry_ids:
+            out.append(Entry.id == _id_array(self.entry_ids))
+        if self.user_ids:
+            out.append(Entry.user_id == _id_array(self.user_ids))
+        if self.users_after is not None:
+            out.append(exists().where(User.id == Entry.user_id, User.created_at > self.users_after))
+        if self.entered_after is not None:
+            out.append(Entry.created_at > self.entered_after)
+        return out
+
+    def describe(self) -> str:
+        parts: Dict[str, Any] = {"giveaway": self.giveaway_id}
+        if self.entry_ids:
+            parts["entries"] = len(self.entry_ids)
+        if self.user_ids:
+            parts["users"] = len(self.user_ids)
+        if self.users_after:
+            parts["users_after"] = self.users_after.isoformat()
+        if self.entered_after:
+            parts["entered_after"] = self.entered_after.isoformat()
+        return " ".join(f"{k}={v}" for k, v in parts.items())
+
+
+async def count_exclude_entries(session: AsyncSession, flt: EntryFilter) -> int:
+    return (await session.execute(select(func.count()).select_from(Entry).where(*flt.where()))).scalar_one()
+
+
+async def exclude_entries(session: AsyncSession, actor: int, flt: EntryFilter) -> int:
+    changed = (await session.execute(
+        update(Entry).where(*flt.where()).values(excluded=True).returning(Entry.id)
+    )).scalars().all()
+    if changed:
+        await session.execute(
+            update(Giveaway)
+            .where(Giveaway.id == flt.giveaway_id)
+            .values(excluded_count=Giveaway.excluded_count + len(changed))
+        )
+    await _audit_many(session, actor, "exclude", "entry", changed, flt.describe())
+    return len(changed)
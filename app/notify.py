@@ -0,0 +1,175 @@
+from __future__ import annotations
+
+import asyncio
+import html
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+from aiogram.types import ReplyParameters
+from sqlalchemy import and_, exists, func, or_, select, update
+
+from app.config import settings
+from app.db import AsyncSessionLocal
+from app.models import Giveaway, User, Winner
+from app.outbound import background
+from app.texts import NO_WINNERS_ANNOUNCE_TEXT, WIN_DM_TEXT, WINNERS_ANNOUNCE_TEXT
+
+log = logging.getLogger(__name__)
+
+_notify_tasks: Dict[int, asyncio.Task] = {}
+
+
+def _winner_line(user_id: int, username: Optional[str]) -> str:
+    if username:
+        return f"- @{html.escape(username)}"
+    return f'- <a href="tg://user?id={user_id}">فائز</a>'
+
+
+def announce_text(winners: List[Winner]) -> str:
+    if not winners:
+        return NO_WINNERS_ANNOUNCE_TEXT
+    return WINNERS_ANNOUNCE_TEXT + "\n" + "\n".join(_winner_line(w.user_id, w.username) for w in winners)
+
+
+def win_dm_text(g: Giveaway) -> str:
+    if g.target_chat_title:
+        return f"{WIN_DM_TEXT} في {html.escape(g.target_chat_title)}."
+    return f"{WIN_DM_TEXT}."
+
+
+async def _send(bot: Bot, chat_id: int, text: str, reply_to: Optional[int] = None) -> str:
+    # TelegramRetryAfter يعالجه outbound_scheduler؛ هنا نعيد المحاولة فقط للأخطاء العابرة
+    reply = ReplyParameters(message_id=reply_to, allow_sending_without_reply=True) if reply_to else None
+    for attempt in range(settings.notify_max_attempts):
+        try:
+            await bot.send_message(chat_id, text, reply_parameters=reply)
+            return "sent"
+        except TelegramForbiddenError:
+            return "blocked"
+        except TelegramBadRequest as e:
+            log.warning("Notification to %s rejected: %s", chat_id, e)
+            return "failed"
+        except Exception:
+            if attempt == settings.notify_max_attempts - 1:
+                log.exception("Notification to %s failed", chat_id)
+                return "failed"
+            await asyncio.sleep(2 ** attempt)
+    return "failed"
+
+
+async def _announce(bot: Bot, g: Giveaway) -> None:
+    # المطالبة قبل الإرسال: عاملان لا يعلنان مرتين، وانهيار أثناء الإرسال لا يعيد الإعلان
+    async with AsyncSessionLocal() as session:
+        claimed = (await session.execute(
+            update(Giveaway)
+            .where(Giveaway.id == g.id, Giveaway.announce_status == "pending")
+            .values(announce_status="sending", announced_at=func.now())
+            .returning(Giveaway.id)
+        )).scalar_one_or_none()
+        await session.commit()
+        if not claimed:
+            return
+        winners = (await session.execute(
+            select(Winner).where(Winner.giveaway_id == g.id).order_by(Winner.id.asc())
+        )).scalars().all()
+
+    status = await _send(bot, g.target_chat_id, announce_text(winners), reply_to=g.published_message_id)
+    async with AsyncSessionLocal() as session:
+        await session.execute(
+            update(Giveaway).where(Giveaway.id == g.id).values(announce_status=status, announced_at=func.now())
+        )
+        await session.commit()
+
+
+async def _notify_winners(bot: Bot, g: Giveaway) -> None:
+    opted_in = exists().where(User.id == Winner.user_id, User.notify_on_win == True)
+    async with AsyncSessionLocal() as session:
+        await session.execute(
+            update(Winner)
+            .where(Winner.giveaway_id == g.id, Winner.notify_status == "pending", ~opted_in)
+            .values(notify_status="skipped", notified_at=func.now())
+        )
+        claimed = (await session.execute(
+            update(Winner)
+            .where(Winner.giveaway_id == g.id, Winner.notify_status == "pending")
+            .values(notify_status="sending", notified_at=func.now())
+            .returning(Winner.id, Winner.user_id)
+        )).all()
+        await session.commit()
+    if not claimed:
+        return
+
+    # الحد لكل محادثة خاصة وللبوت كله يفرضه outbound_scheduler، فالتوازي هنا آمن
+    text = win_dm_text(g)
+    sem = asyncio.Semaphore(settings.notify_concurrency)
+
+    async def one(user_id: int) -> str:
+        async with sem:
+            return await _send(bot, user_id, text)
+
+    results = await asyncio.gather(*(one(r.user_id) for r in claimed))
+    now = datetime.now(timezone.utc)
+    async with AsyncSessionLocal() as session:
+        await session.execute(
+            update(Winner),
+            [{"id": r.id, "notify_status": status, "notified_at": now} for r, status in zip(claimed, results)],
+        )
+        await session.commit()
+
+
+async def deliver(bot: Bot, giveaway_id: int) -> None:
+    async with AsyncSessionLocal() as session:
+        g = await session.get(Giveaway, giveaway_id)
+    if not g or not g.is_drawn:
+        return
+    await _announce(bot, g)
+    await _notify_winners(bot, g)
+
+
+@background
+async def _run_notify(bot: Bot, giveaway_id: int) -> None:
+    try:
+        await deliver(bot, giveaway_id)
+    except Exception:
+        log.exception("Winner notification failed for giveaway %s", giveaway_id)
+    finally:
+        _notify_tasks.pop(giveaway_id, None)
+
+
+def request_notify(bot: Bot, giveaway_id: int) -> None:
+    # لا يوقف حلقة السحب: الإعلان والرسائل في مهمة منفصلة
+    if giveaway_id in _notify_tasks:
+        return
+    _notify_tasks[giveaway_id] = asyncio.create_task(_run_notify(bot, giveaway_id))
+
+
+async def resume_pending(bot: Bot) -> int:
+    # بعد انهيار: ما بقي 'sending' طويلًا لا نعرف هل أُرسل، فنعلّمه failed بدل الإرسال مرتين
+    stale = func.now() - timedelta(minutes=settings.notify_stale_minutes)
+    async with AsyncSessionLocal() as session:
+        await session.execute(
+            update(Giveaway)
+            .where(Giveaway.announce_status == "sending", Giveaway.announced_at < stale)
+            .values(announce_status="failed")
+        )
+        await session.execute(
+            update(Winner)
+            .where(Winner.notify_status == "sending", Winner.notified_at < stale)
+            .values(notify_status="failed")
+        )
+        ids = (await session.execute(
+            select(Giveaway.id).where(
+                Giveaway.is_drawn == True,
+                or_(
+                    Giveaway.announce_status == "pending",
+                    exists().where(and_(Winner.giveaway_id == Giveaway.id, Winner.notify_status == "pending")),
+                ),
+            ).limit(100)
+        )).scalars().all()
+        await session.commit()
+    for giveaway_id in ids:
+        request_notify(bot, giveaway_id)
+    return len(ids)
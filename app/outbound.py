@@ -0,0 +1,193 @@
+from __future__ import annotations
+
+import asyncio
+import functools
+import heapq
+import itertools
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple, TypeVar
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+
+from app.config import settings
+from app.ratelimit import TokenBucket
+
+# الأولوية الأعلى أولًا: ردود المستخدم التفاعلية قبل السجلات قبل المهام الخلفية
+PRIORITY_CLASSES = ("interactive", "log", "background")
+_PRIORITY = {name: i for i, name in enumerate(PRIORITY_CLASSES)}
+
+_current_class: ContextVar[str] = ContextVar("outbound_class", default="interactive")
+
+T = TypeVar("T")
+
+
+@contextmanager
+def outbound_priority(name: str) -> Iterator[None]:
+    # المهام التي تُنشأ داخل هذا السياق ترث نفس الفئة
+    token = _current_class.set(name)
+    try:
+        yield
+    finally:
+        _current_class.reset(token)
+
+
+def background(fn: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+    @functools.wraps(fn)
+    async def wrapper(*args: Any, **kwargs: Any) -> T:
+        with outbound_priority("background"):
+            return await fn(*args, **kwargs)
+    return wrapper
+
+
+def _is_chat_send(api_method: str) -> bool:
+    return api_method.startswith(("send", "edit", "copyMessage", "forwardMessage"))
+
+
+def _parse_method_rates(raw: str) -> Dict[str, float]:
+    out: Dict[str, float] = {}
+    for part in [x.strip() for x in raw.split(",") if x.strip()]:
+        name, _, value = part.partition("=")
+        try:
+            out[name.strip()] = float(value)
+        except ValueError:
+            continue
+    return out
+
+
+class PriorityBucket:
+    # دلو رموز واحد، والانتظار فيه حسب الأولوية ثم الأقدم
+    def __init__(self, rate: float):
+        self.bucket = TokenBucket(rate)
+        self._heap: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._task: Optional[asyncio.Task] = None
+
+    async def acquire(self, priority: int) -> None:
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._heap, (priority, next(self._seq), fut))
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._dispatch())
+        await fut
+
+    async def _dispatch(self) -> None:
+        while self._heap:
+            await self.bucket.acquire()
+            while self._heap:
+                _, _, fut = heapq.heappop(self._heap)
+                if not fut.done():
+                    fut.set_result(None)
+                    break
+
+    def queued(self) -> Dict[str, int]:
+        out = {name: 0 for name in PRIORITY_CLASSES}
+        for priority, _, fut in self._heap:
+            if not fut.done():
+                out[PRIORITY_CLASSES[priority]] += 1
+        return out
+
+
+class _ClassStats:
+    __slots__ = ("requests", "wait_total", "wait_max", "retries")
+
+    def __init__(self):
+        self.requests = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.retries = 0
+
+
+class OutboundScheduler(BaseRequestMiddleware):
+    # middleware على جلسة البوت: كل طلبات bot.* من كل الوحدات تمر من هنا
+    def __init__(
+        self,
+        global_rate: float,
+        private_chat_rate: float,
+        group_per_minute: float,
+        method_rates: Dict[str, float],
+        max_retries: int = 3,
+        max_chats: int = 10_000,
+    ):
+        self.global_bucket = PriorityBucket(global_rate)
+        self.private_chat_rate = private_chat_rate
+        self.group_rate = group_per_minute / 60
+        self.method_buckets = {name: TokenBucket(rate) for name, rate in method_rates.items()}
+        self.max_retries = max(1, max_retries)
+        self.max_chats = max_chats
+        self._chat_buckets: OrderedDict[Any, TokenBucket] = OrderedDict()
+        self._stats = {name: _ClassStats() for name in PRIORITY_CLASSES}
+
+    def _chat_bucket(self, chat_id: Any) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            # المعرّفات السالبة واليوزرات = قنوات/قروبات (حد 20 بالدقيقة)، الموجبة = محادثات خاصة
+            is_private = isinstance(chat_id, int) and chat_id > 0
+            bucket = TokenBucket(self.private_chat_rate if is_private else self.group_rate)
+            self._chat_buckets[chat_id] = bucket
+            while len(self._chat_buckets) > self.max_chats:
+                self._chat_buckets.popitem(last=False)
+        else:
+            self._chat_buckets.move_to_end(chat_id)
+        return bucket
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        cls = _current_class.get()
+        stats = self._stats.get(cls) or self._stats["interactive"]
+        priority = _PRIORITY.get(cls, 0)
+        api_method = method.__api_method__
+        chat_id = getattr(method, "chat_id", None)
+        chat_bucket = self._chat_bucket(chat_id) if chat_id is not None and _is_chat_send(api_method) else None
+        method_bucket = self.method_buckets.get(api_method)
+
+        for attempt in range(self.max_retries):
+            started = time.monotonic()
+            if chat_bucket is not None:
+                await chat_bucket.acquire()
+            if method_bucket is not None:
+                await method_bucket.acquire()
+            await self.global_bucket.acquire(priority)
+            waited = time.monotonic() - started
+            stats.requests += 1
+            stats.wait_total += waited
+            stats.wait_max = max(stats.wait_max, waited)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                if attempt == self.max_retries - 1:
+                    raise
+                stats.retries += 1
+                (chat_bucket or method_bucket or self.global_bucket.bucket).pause(e.retry_after)
+        raise RuntimeError("unreachable")
+
+    def stats(self) -> Dict[str, Any]:
+        queued = self.global_bucket.queued()
+        return {
+            name: {
+                "requests": s.requests,
+                "queued": queued[name],
+                "avg_wait_ms": round(1000 * s.wait_total / s.requests, 2) if s.requests else 0.0,
+                "max_wait_ms": round(1000 * s.wait_max, 2),
+                "retries": s.retries,
+            }
+            for name, s in self._stats.items()
+        }
+
+
+outbound_scheduler = OutboundScheduler(
+    global_rate=settings.outbound_global_rate,
+    private_chat_rate=settings.outbound_private_chat_rate,
+    group_per_minute=settings.outbound_group_per_minute,
+    method_rates=_parse_method_rates(settings.outbound_method_rates),
+    max_retries=settings.outbound_max_retries,
+)
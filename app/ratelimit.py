@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Optional, TypeVar
+
+from aiogram.exceptions import TelegramRetryAfter
+
+T = TypeVar("T")
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = max(rate, 0.001)
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+        self.waited = 0.0
+        self.retry_after_hits = 0
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, tokens: float = 1.0) -> None:
+        started = time.monotonic()
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._refill(now)
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    break
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+        self.waited += time.monotonic() - started
+
+    def is_idle(self) -> bool:
+        # امتلأ من جديد ولا إيقاف: حذفه وإنشاء غيره لاحقًا لا يغيّر السرعة
+        now = time.monotonic()
+        self._refill(now)
+        return self._tokens >= self.capacity and now >= self._paused_until
+
+    def pause(self, seconds: float) -> None:
+        # 429 من تيليجرام: نوقف كل المستهلكين حتى انتهاء retry_after
+        self.retry_after_hits += 1
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+
+    async def call(self, fn: Callable[..., Awaitable[T]], *args: Any, attempts: int = 3, **kwargs: Any) -> T:
+        for attempt in range(attempts):
+            await self.acquire()
+            try:
+                return await fn(*args, **kwargs)
+            except TelegramRetryAfter as e:
+                self.pause(e.retry_after)
+                if attempt == attempts - 1:
+                    raise
+        raise RuntimeError("unreachable")
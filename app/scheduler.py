@@ -1,128 +1,244 @@
 from __future__ import annotations
 
-import random
-from datetime import datetime, timezone
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List
 
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from sqlalchemy import select, func
+from sqlalchemy import select, update
 from aiogram import Bot
 
 from app.config import settings
-from app.models import User, Giveaway, Entry, Winner, AuditLog
+from app.models import User, Giveaway, Winner, AuditLog
 from app.db import AsyncSessionLocal
+from app.membership import membership_cache, membership_limiter
+from app.throttle import click_throttle
+from app.outbound import background
+from app.channels import mandatory_channels
+from app.user_cache import user_state_cache
+from app.draw import pick_winners, iter_random_entries
+from app.fsm_storage import DbStorage
+from app.leader import leader_only, try_draw_lock
+from app.shards import Lease, balanced_ranges, plan_shards, run_shards
+from app.notify import request_notify, resume_pending
+from app.broadcast import run_broadcasts
+
+log = logging.getLogger(__name__)
 
 scheduler = AsyncIOScheduler(timezone="UTC")
 
+SWEEP_JOB = "membership_sweep"
+DRAW_JOB = "auto_draw"
+
+_draw_tasks: Dict[int, asyncio.Task] = {}
+
 
 async def audit(session, actor: int | None, action: str, entity: str, entity_id: str | None, detail: str | None):
     session.add(AuditLog(actor_user_id=actor, action=action, entity=entity, entity_id=entity_id, detail=detail))
 
 
+async def _user_membership_ok(bot: Bot, chat_ids: List[int], user_id: int, sem: asyncio.Semaphore) -> bool:
+    async with sem:
+        for cid in chat_ids:
+            try:
+                # القنوات المتتبَّعة تُقرأ من جدول chat_members، والبقية تُسأل مباشرة
+                fresh = not membership_cache.is_tracked(cid)
+                if not await membership_cache.is_member(bot, cid, user_id, fresh=fresh, limiter=membership_limiter):
+                    return False
+            except Exception:
+                # لا نعلّق تلقائيًا إذا تعذر التحقق
+                continue
+        return True
+
+
+def _sweep_filter():
+    return (User.gate_verified == True, User.is_banned == False)
+
+
+@leader_only
 async def check_mandatory_membership_job(bot: Bot):
-    if not settings.mandatory_channels_list:
+    # القائد يقسم المستخدمين إلى مجالات فقط، والفحص نفسه يتوزع على كل العمال عبر shard_worker_job
+    if not mandatory_channels.configured:
         return
+    ranges = await balanced_ranges(User.id, *_sweep_filter(), shards=settings.shard_sweep_count)
+    if not await plan_shards(SWEEP_JOB, ranges):
+        log.info("Previous membership sweep still running, not planning a new one")
+
+
+async def _sweep_shard(bot: Bot, chat_ids: List[int], lease: Lease) -> None:
+    claim = lease.claim
+    sem = asyncio.Semaphore(settings.sweep_concurrency)
+
+    while not lease.lost:
+        q = select(User.id, User.suspended).where(*_sweep_filter(), User.id > claim.cursor)
+        if claim.range_end is not None:
+            q = q.where(User.id <= claim.range_end)
+        async with AsyncSessionLocal() as session:
+            rows = (await session.execute(q.order_by(User.id.asc()).limit(settings.sweep_batch_size))).all()
+        if not rows:
+            return
 
+        results = await asyncio.gather(*(_user_membership_ok(bot, chat_ids, r.id, sem) for r in rows))
+        to_suspend = [r.id for r, ok in zip(rows, results) if not ok and not r.suspended]
+        to_restore = [r.id for r, ok in zip(rows, results) if ok and r.suspended]
+
+        # نكمل من آخر نقطة محفوظة إذا انقطع الفحص (أو أخذ عامل آخر الجزء)
+        async with AsyncSessionLocal() as session:
+            if not await lease.checkpoint(session, rows[-1].id):
+                return
+            if to_suspend:
+                await session.execute(update(User).where(User.id.in_(to_suspend)).values(suspended=True))
+            if to_restore:
+                await session.execute(update(User).where(User.id.in_(to_restore)).values(suspended=False))
+            await session.commit()
+        user_state_cache.invalidate_many(to_suspend + to_restore)
+
+
+@leader_only
+@background
+async def reconcile_membership_job(bot: Bot):
+    stale = await membership_cache.table.stale(
+        timedelta(hours=settings.membership_reconcile_hours),
+        settings.membership_reconcile_batch,
+    )
+    for chat_id, user_id in stale:
+        if not membership_cache.is_tracked(chat_id):
+            continue
+        try:
+            await membership_cache.get_status(bot, chat_id, user_id, fresh=True, limiter=membership_limiter)
+        except Exception:
+            continue
+
+
+async def draw_giveaway(bot: Bot, giveaway_id: int) -> bool:
     async with AsyncSessionLocal() as session:
-        users = (await session.execute(
-            select(User).where(User.gate_verified == True, User.is_banned == False)
-        )).scalars().all()
-        if not users:
-            return
+        # قفل advisory لكل سحب يمنع سحبين متزامنين (بين العمليات أيضًا).
+        # لا قفل على صف السحب أثناء pick_winners: كل ضغطة مشاركة تحدّث الصف نفسه
+        if not await try_draw_lock(session, giveaway_id):
+            return False
+        g = (await session.execute(
+            select(Giveaway).where(Giveaway.id == giveaway_id, Giveaway.is_drawn == False)
+        )).scalar_one_or_none()
+        if not g or not g.auto_draw_enabled or g.auto_draw_entries_threshold is None:
+            return False
+
+        if g.entries_count - g.excluded_count < int(g.auto_draw_entries_threshold or 0):
+            return False
+
+        winners = await pick_winners(bot, g, iter_random_entries(session, g.id))
+
+        # تحديث مشروط قصير في النهاية: يقفل الصف لحظة الإنهاء فقط
+        drawn = (await session.execute(
+            update(Giveaway)
+            .where(Giveaway.id == g.id, Giveaway.is_drawn == False)
+            .values(is_drawn=True, drawn_at=datetime.now(timezone.utc))
+            .returning(Giveaway.id)
+        )).scalar_one_or_none()
+        if drawn is None:
+            await session.rollback()
+            return False
+
+        for w in winners:
+            session.add(Winner(giveaway_id=g.id, user_id=w.user_id, username=w.username))
+        detail = f"winners={len(winners)}" if winners else "No eligible candidates"
+        await audit(session, g.creator_user_id, "draw", "giveaway", str(g.id), detail)
+        await session.commit()
+        request_notify(bot, g.id)
+        return True
 
-        mandatory_chat_ids = []
-        for ch in settings.mandatory_channels_list:
-            try:
-                if ch.startswith("@"):
-                    chat = await bot.get_chat(ch)
-                elif "t.me/" in ch:
-                    username = ch.split("t.me/")[-1].split("?")[0].strip("/")
-                    chat = await bot.get_chat(f"@{username}")
-                else:
-                    continue
-                mandatory_chat_ids.append(chat.id)
-            except Exception:
-                continue
 
-        for u in users:
-            ok = True
-            for cid in mandatory_chat_ids:
-                try:
-                    cm = await bot.get_chat_member(cid, u.id)
-                    if cm.status in ("left", "kicked"):
-                        ok = False
-                        break
-                except Exception:
-                    # لا نعلّق تلقائيًا إذا تعذر التحقق
-                    continue
-            if not ok and not u.suspended:
-                u.suspended = True
-            if ok and u.suspended:
-                u.suspended = False
+@background
+async def _run_draw(bot: Bot, giveaway_id: int) -> None:
+    try:
+        await draw_giveaway(bot, giveaway_id)
+    except Exception:
+        log.exception("Draw failed for giveaway %s", giveaway_id)
+    finally:
+        _draw_tasks.pop(giveaway_id, None)
+
+
+def request_draw(bot: Bot, giveaway_id: int) -> None:
+    # يُستدعى من participate عند بلوغ العتبة؛ سحب واحد جارٍ لكل سحب في هذه العملية
+    if giveaway_id in _draw_tasks:
+        return
+    _draw_tasks[giveaway_id] = asyncio.create_task(_run_draw(bot, giveaway_id))
 
-        await session.commit()
 
+def _pending_draw_filter():
+    return (
+        Giveaway.auto_draw_enabled == True,
+        Giveaway.is_drawn == False,
+        Giveaway.auto_draw_entries_threshold.is_not(None),
+    )
 
-async def _eligible_on_draw(bot: Bot, g: Giveaway, user_id: int) -> bool:
-    # شروط القنوات فقط (Premium لا يمكن إعادة التحقق منه رسميًا من API)
-    for cond in (g.cond_channel_1, g.cond_channel_2):
-        if cond:
+
+@leader_only
+async def auto_draw_job(bot: Bot):
+    # شبكة أمان فقط: السحب الفعلي يُطلق فور بلوغ العتبة من participate
+    ranges = await balanced_ranges(Giveaway.id, *_pending_draw_filter(), shards=settings.shard_draw_count)
+    await plan_shards(DRAW_JOB, ranges)
+
+
+async def _draw_shard(bot: Bot, lease: Lease) -> None:
+    claim = lease.claim
+    while not lease.lost:
+        q = select(Giveaway.id).where(*_pending_draw_filter(), Giveaway.id > claim.cursor)
+        if claim.range_end is not None:
+            q = q.where(Giveaway.id <= claim.range_end)
+        async with AsyncSessionLocal() as session:
+            ids = (await session.execute(q.order_by(Giveaway.id.asc()).limit(100))).scalars().all()
+        if not ids:
+            return
+        for giveaway_id in ids:
             try:
-                cm = await bot.get_chat_member(cond, user_id)
-                if cm.status in ("left", "kicked"):
-                    return False
+                await draw_giveaway(bot, giveaway_id)
             except Exception:
-                if g.anti_fraud_recheck_on_draw:
-                    return False
-    if g.paid_comment_condition_enabled:
-        # لا ندّعي تحقق رسمي
-        return False
-    return True
+                log.exception("Draw failed for giveaway %s", giveaway_id)
+            async with AsyncSessionLocal() as session:
+                if not await lease.checkpoint(session, giveaway_id):
+                    return
+                await session.commit()
 
 
-async def auto_draw_job(bot: Bot):
-    async with AsyncSessionLocal() as session:
-        giveaways = (await session.execute(
-            select(Giveaway).where(
-                Giveaway.auto_draw_enabled == True,
-                Giveaway.is_drawn == False,
-                Giveaway.auto_draw_entries_threshold.is_not(None),
-            )
-        )).scalars().all()
-
-        for g in giveaways:
-            total_entries = (await session.execute(
-                select(func.count(Entry.id)).where(Entry.giveaway_id == g.id, Entry.excluded == False)
-            )).scalar_one()
-
-            if total_entries < int(g.auto_draw_entries_threshold or 0):
-                continue
+@background
+async def shard_worker_job(bot: Bot):
+    # يعمل في كل عامل: يأخذ ما هو متاح من أجزاء السحب والفحص حتى تنفد
+    await run_shards(DRAW_JOB, lambda lease: _draw_shard(bot, lease))
 
-            entries = (await session.execute(
-                select(Entry).where(Entry.giveaway_id == g.id, Entry.excluded == False).order_by(Entry.id.asc())
-            )).scalars().all()
-
-            candidates = []
-            if g.anti_fraud_recheck_on_draw:
-                for e in entries:
-                    if await _eligible_on_draw(bot, g, e.user_id):
-                        candidates.append(e)
-            else:
-                candidates = entries
-
-            if not candidates:
-                g.is_drawn = True
-                g.drawn_at = datetime.now(timezone.utc)
-                await audit(session, g.creator_user_id, "draw", "giveaway", str(g.id), "No eligible candidates")
-                await session.commit()
-                continue
+    if mandatory_channels.configured:
+        if not mandatory_channels.fully_resolved:
+            await mandatory_channels.refresh(bot, only_missing=True)
+        chat_ids = mandatory_channels.chat_ids()
+        if chat_ids:
+            await run_shards(SWEEP_JOB, lambda lease: _sweep_shard(bot, chat_ids, lease))
 
-            k = min(g.winners_count, len(candidates))
-            winners = random.sample(candidates, k=k)
 
-            for w in winners:
-                session.add(Winner(giveaway_id=g.id, user_id=w.user_id, username=w.username))
+async def broadcast_worker_job(bot: Bot):
+    # مهمة منفصلة عن shard_worker_job حتى لا توقف إذاعة طويلة السحب والفحص في هذا العامل
+    await run_broadcasts(bot)
 
-            g.is_drawn = True
-            g.drawn_at = datetime.now(timezone.utc)
-            await audit(session, g.creator_user_id, "draw", "giveaway", str(g.id), f"winners={k}")
-            await session.commit()
+
+@leader_only
+async def notify_resume_job(bot: Bot):
+    await resume_pending(bot)
+
+
+async def membership_cache_cleanup_job():
+    await membership_cache.cleanup_expired()
+    await membership_cache.load_tracked()
+
+
+async def throttle_cleanup_job():
+    await click_throttle.cleanup()
+
+
+@leader_only
+async def fsm_cleanup_job(storage):
+    if isinstance(storage, DbStorage):
+        await storage.cleanup(timedelta(hours=settings.fsm_state_ttl_hours))
+
+
+@background
+async def refresh_mandatory_channels_job(bot: Bot):
+    await mandatory_channels.refresh(bot)
@@ -0,0 +1,221 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import socket
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import Float, delete, func, literal, or_, select, update
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.db import AsyncSessionLocal
+from app.models import JobShard
+
+log = logging.getLogger(__name__)
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+@dataclass
+class ShardClaim:
+    job: str
+    shard: int
+    shard_count: int
+    generation: int
+    range_start: int
+    range_end: Optional[int]
+    cursor: int
+    attempts: int = 1
+
+
+class Lease:
+    # يجدد العقد في الخلفية ما دام العمل جاريًا؛ إذا أخذ عامل آخر الجزء (انتهى العقد) نتوقف
+    def __init__(self, claim: ShardClaim, lease_seconds: float):
+        self.claim = claim
+        self.lease = timedelta(seconds=lease_seconds)
+        self.interval = max(lease_seconds / 3, 1)
+        self.lost = False
+        self._task: Optional[asyncio.Task] = None
+
+    def _mine(self):
+        c = self.claim
+        return (
+            JobShard.job == c.job,
+            JobShard.shard == c.shard,
+            JobShard.generation == c.generation,
+            JobShard.lease_owner == WORKER_ID,
+        )
+
+    async def _heartbeat(self) -> None:
+        while not self.lost:
+            await asyncio.sleep(self.interval)
+            try:
+                async with AsyncSessionLocal() as session:
+                    res = await session.execute(
+                        update(JobShard).where(*self._mine()).values(lease_until=func.now() + self.lease)
+                    )
+                    await session.commit()
+                if not res.rowcount:
+                    self.lost = True
+            except Exception:
+                log.exception("Lease heartbeat failed for %s/%s", self.claim.job, self.claim.shard)
+
+    async def checkpoint(self, session: AsyncSession, cursor: int) -> bool:
+        # يُنفَّذ في معاملة المستدعي نفسها، فالتقدم ونتيجة الدفعة يُحفظان معًا.
+        # التقدم يعيد عدّاد المحاولات: إعادة الأخذ بعد انهيار أو نشر ليست فشلًا،
+        # وإلا تُترك مهمة طويلة (إذاعة لساعات) بعد SHARD_MAX_ATTEMPTS إعادة تشغيل
+        res = await session.execute(update(JobShard).where(*self._mine()).values(cursor=cursor, attempts=1))
+        if not res.rowcount:
+            self.lost = True
+            return False
+        self.claim.cursor = cursor
+        self.claim.attempts = 1
+        return True
+
+    async def complete(self) -> None:
+        async with AsyncSessionLocal() as session:
+            await session.execute(
+                update(JobShard).where(*self._mine()).values(done=True, lease_owner=None, lease_until=None)
+            )
+            await session.commit()
+
+    async def release(self) -> None:
+        # فشل غير متوقع: لا نعيد الجزء فورًا (خطأ عابر كان سيستهلك كل المحاولات في أجزاء من الثانية)،
+        # بل بعد مهلة تتضاعف مع كل محاولة ولا تتجاوز مدة العقد
+        backoff = min(settings.shard_poll_seconds * 2 ** (self.claim.attempts - 1), settings.shard_lease_seconds)
+        async with AsyncSessionLocal() as session:
+            await session.execute(
+                update(JobShard)
+                .where(*self._mine())
+                .values(lease_owner=None, lease_until=func.now() + timedelta(seconds=backoff))
+            )
+            await session.commit()
+
+    async def __aenter__(self) -> "Lease":
+        self._task = asyncio.create_task(self._heartbeat())
+        return self
+
+    async def __aexit__(self, *exc: Any) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+
+def _unfinished():
+    return (JobShard.done == False, JobShard.attempts < settings.shard_max_attempts)
+
+
+async def plan_shards(job: str, ranges: Sequence[Tuple[int, Optional[int]]]) -> bool:
+    # جولة جديدة فقط إذا انتهت السابقة؛ الأجزاء التي تجاوزت عدد المحاولات تُعد منتهية
+    async with AsyncSessionLocal() as session:
+        rows = (await session.execute(
+            select(JobShard).where(JobShard.job == job).with_for_update()
+        )).scalars().all()
+        pending = [r for r in rows if not r.done and r.attempts < settings.shard_max_attempts]
+        if pending:
+            return False
+        for r in rows:
+            if not r.done:
+                log.warning("Shard %s/%s gave up after %s attempts", job, r.shard, r.attempts)
+        generation = max((r.generation for r in rows), default=0) + 1
+        await session.execute(delete(JobShard).where(JobShard.job == job))
+        for i, (start, end) in enumerate(ranges):
+            session.add(JobShard(
+                job=job, shard=i, shard_count=len(ranges), generation=generation,
+                range_start=start, range_end=end, cursor=start,
+            ))
+        await session.commit()
+        return True
+
+
+async def claim_shard(job: str) -> Optional[ShardClaim]:
+    async with AsyncSessionLocal() as session:
+        row = (await session.execute(
+            select(JobShard)
+            .where(
+                JobShard.job == job,
+                *_unfinished(),
+                or_(JobShard.lease_until.is_(None), JobShard.lease_until < func.now()),
+            )
+            .order_by(JobShard.shard.asc())
+            .limit(1)
+            .with_for_update(skip_locked=True)
+        )).scalar_one_or_none()
+        if row is None:
+            return None
+        if row.lease_owner is not None:
+            log.warning("Reclaiming shard %s/%s from %s", job, row.shard, row.lease_owner)
+        row.lease_owner = WORKER_ID
+        row.lease_until = func.now() + timedelta(seconds=settings.shard_lease_seconds)
+        row.attempts = row.attempts + 1
+        claim = ShardClaim(
+            job=row.job, shard=row.shard, shard_count=row.shard_count, generation=row.generation,
+            range_start=row.range_start, range_end=row.range_end, cursor=row.cursor,
+            attempts=row.attempts,
+        )
+        await session.commit()
+        return claim
+
+
+async def run_shards(job: str, handler: Callable[[Lease], Awaitable[None]]) -> int:
+    # يأخذ الأجزاء المتاحة واحدًا تلو الآخر حتى لا يبقى شيء؛ كل عامل يشغّل هذا بالتوازي.
+    # يعيد عدد الأجزاء التي أكملها هذا العامل
+    processed = 0
+    while True:
+        claim = await claim_shard(job)
+        if claim is None:
+            return processed
+        async with Lease(claim, settings.shard_lease_seconds) as lease:
+            try:
+                await handler(lease)
+            except Exception:
+                log.exception("Shard %s/%s failed", job, claim.shard)
+                await lease.release()
+                continue
+            if lease.lost:
+                continue
+            await lease.complete()
+        processed += 1
+
+
+async def shard_stats() -> Dict[str, Any]:
+    async with AsyncSessionLocal() as session:
+        rows = (await session.execute(
+            select(
+                JobShard.job,
+                func.max(JobShard.generation).label("generation"),
+                func.count().label("shards"),
+                func.count().filter(JobShard.done == True).label("done"),
+                func.count().filter(JobShard.done == False, JobShard.lease_until > func.now()).label("leased"),
+            ).group_by(JobShard.job)
+        )).all()
+    return {r.job: {"generation": r.generation, "shards": r.shards, "done": r.done, "leased": r.leased} for r in rows}
+
+
+async def balanced_ranges(column, *where, shards: int) -> List[Tuple[int, Optional[int]]]:
+    # المعرّفات متفرقة (معرّفات تيليجرام)، فنقسم حسب التوزيع الفعلي لا حسب القيم
+    if shards <= 1:
+        return [(0, None)]
+    fractions = [i / shards for i in range(1, shards)]
+    async with AsyncSessionLocal() as session:
+        boundaries = (await session.execute(
+            select(func.percentile_disc(literal(fractions, ARRAY(Float))).within_group(column.asc())).where(*where)
+        )).scalar()
+    return split_ranges([b for b in (boundaries or []) if b is not None])
+
+
+def split_ranges(boundaries: List[int]) -> List[Tuple[int, Optional[int]]]:
+    # حدود مرتبة -> مجالات (start, end] متتالية، الأخير مفتوح
+    out: List[Tuple[int, Optional[int]]] = []
+    start = 0
+    for b in sorted(set(boundaries)):
+        if b > start:
+            out.append((start, b))
+            start = b
+    out.append((start, None))
+    return out
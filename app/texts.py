@@ -28,6 +28,10 @@ PUBLISHED_TEXT = "تم نشر السحب"
 POPUP_ENABLED_NOTIFY = "تم تفعيل الإشعار"
 NOTIFY_INFO = "ستتلقى إشعارًا إذا فزت… بشرط ألا تحذف المحادثة"
 
+WINNERS_ANNOUNCE_TEXT = "🎉 انتهى السحب! الفائزون:"
+NO_WINNERS_ANNOUNCE_TEXT = "انتهى السحب دون فائزين مؤهلين."
+WIN_DM_TEXT = "🎉 مبروك! لقد فزت في السحب"
+
 LOG_ENTRY_NEW = "مشاركة جديدة في سحبك!"
 
 CHANNEL_LOG_ENTRY_TEXT = (
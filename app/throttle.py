@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Any, Dict
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.postgresql import insert
+
+from app.config import settings
+from app.db import AsyncSessionLocal
+from app.models import ClickThrottle
+
+
+class MemoryThrottleBackend:
+    # المفاتيح مرتبة حسب آخر ضغطة، فالمنتهي منها دائمًا في المقدمة ويُحذف أولًا بأول
+    name = "memory"
+
+    def __init__(self, maxsize: int):
+        self.maxsize = max(1, maxsize)
+        self._data: OrderedDict[str, float] = OrderedDict()
+
+    def _evict(self, now: float, window: float) -> None:
+        while self._data:
+            key, ts = next(iter(self._data.items()))
+            if now - ts < window and len(self._data) <= self.maxsize:
+                break
+            self._data.popitem(last=False)
+
+    async def hit(self, key: str, window: float) -> bool:
+        now = time.monotonic()
+        self._evict(now, window)
+        if key in self._data:
+            return False
+        self._data[key] = now
+        self._evict(now, window)
+        return True
+
+    async def cleanup(self, window: float) -> None:
+        self._evict(time.monotonic(), window)
+
+    async def size(self) -> int:
+        return len(self._data)
+
+
+class DbThrottleBackend:
+    # مشترك بين كل العمليات: الضغطة مسموحة فقط إذا أُدرج الصف أو كان أقدم من النافذة
+    name = "db"
+
+    async def hit(self, key: str, window: float) -> bool:
+        stmt = insert(ClickThrottle).values(key=key, hit_at=func.now())
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[ClickThrottle.key],
+            set_={"hit_at": func.now()},
+            where=ClickThrottle.hit_at < func.now() - timedelta(seconds=window),
+        ).returning(ClickThrottle.key)
+        async with AsyncSessionLocal() as session:
+            allowed = (await session.execute(stmt)).first() is not None
+            await session.commit()
+        return allowed
+
+    async def cleanup(self, window: float) -> None:
+        async with AsyncSessionLocal() as session:
+            await session.execute(
+                delete(ClickThrottle).where(ClickThrottle.hit_at < func.now() - timedelta(seconds=window))
+            )
+            await session.commit()
+
+    async def size(self) -> int:
+        async with AsyncSessionLocal() as session:
+            return (await session.execute(select(func.count()).select_from(ClickThrottle))).scalar_one()
+
+
+class Throttle:
+    def __init__(self, backend, window: float):
+        self.backend = backend
+        self.window = window
+        self.allowed = 0
+        self.rejected = 0
+
+    async def hit(self, key: str) -> bool:
+        ok = await self.backend.hit(key, self.window)
+        if ok:
+            self.allowed += 1
+        else:
+            self.rejected += 1
+        return ok
+
+    async def cleanup(self) -> None:
+        await self.backend.cleanup(self.window)
+
+    async def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.backend.name,
+            "window": self.window,
+            "keys": await self.backend.size(),
+            "allowed": self.allowed,
+            "rejected": self.rejected,
+        }
+
+
+def _make_backend():
+    if settings.throttle_backend == "db":
+        return DbThrottleBackend()
+    return MemoryThrottleBackend(settings.throttle_max_keys)
+
+
+click_throttle = Throttle(_make_backend(), settings.throttle_window_seconds)
@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+log = logging.getLogger(__name__)
+
+# inline: معالجة التحديث داخل الطلب نفسه عند امتلاء الطابور (لا يضيع شيء)
+# reject: إرجاع 503 ليعيد تيليجرام الإرسال لاحقًا
+# drop_oldest: إسقاط أقدم تحديث في الطابور لصالح الجديد
+OVERFLOW_POLICIES = ("inline", "reject", "drop_oldest")
+
+
+class QueueFull(Exception):
+    pass
+
+
+class UpdateQueue:
+    def __init__(self, bot: Bot, dp: Dispatcher, maxsize: int, workers: int, overflow: str = "inline"):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+        self.bot = bot
+        self.dp = dp
+        self.maxsize = max(1, maxsize)
+        self.workers = max(1, workers)
+        self.overflow = overflow
+
+        self._queue: Optional[asyncio.Queue[Tuple[float, Update]]] = None
+        self._tasks: List[asyncio.Task] = []
+        self._busy = 0
+        self._busy_seconds = 0.0
+        self._wait_seconds = 0.0
+        self._started_at = 0.0
+
+        self.enqueued = 0
+        self.processed = 0
+        self.failed = 0
+        self.inline = 0
+        self.rejected = 0
+        self.dropped = 0
+        self.max_depth = 0
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    async def start(self) -> None:
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._started_at = time.monotonic()
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        if self._queue is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            log.warning("Update queue stopped with %s pending updates", self.depth)
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def put(self, update: Update) -> None:
+        assert self._queue is not None, "UpdateQueue.start() was not called"
+        item = (time.monotonic(), update)
+        try:
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+            if self.overflow == "reject":
+                self.rejected += 1
+                raise QueueFull()
+            if self.overflow == "drop_oldest":
+                try:
+                    self._queue.get_nowait()
+                    self._queue.task_done()
+                    self.dropped += 1
+                except asyncio.QueueEmpty:
+                    pass
+                self._queue.put_nowait(item)
+            else:
+                self.inline += 1
+                await self.process(update)
+                return
+
+        self.enqueued += 1
+        self.max_depth = max(self.max_depth, self._queue.qsize())
+
+    async def process(self, update: Update) -> None:
+        await self.dp.feed_update(self.bot, update)
+
+    async def _worker(self, n: int) -> None:
+        assert self._queue is not None
+        while True:
+            enqueued_at, update = await self._queue.get()
+            started = time.monotonic()
+            self._wait_seconds += started - enqueued_at
+            self._busy += 1
+            try:
+                await self.process(update)
+                self.processed += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self.failed += 1
+                log.exception("Worker %s failed on update %s", n, update.update_id)
+            finally:
+                self._busy -= 1
+                self._busy_seconds += time.monotonic() - started
+                self._queue.task_done()
+
+    def stats(self) -> Dict[str, Any]:
+        uptime = max(time.monotonic() - self._started_at, 1e-9) if self._started_at else 0.0
+        done = self.processed + self.failed
+        return {
+            "depth": self.depth,
+            "max_depth": self.max_depth,
+            "maxsize": self.maxsize,
+            "overflow": self.overflow,
+            "workers": self.workers,
+            "busy_workers": self._busy,
+            "utilisation": round(self._busy / self.workers, 3),
+            "avg_utilisation": round(self._busy_seconds / (uptime * self.workers), 3) if uptime else 0.0,
+            "avg_wait_ms": round(1000 * self._wait_seconds / done, 2) if done else 0.0,
+            "enqueued": self.enqueued,
+            "processed": self.processed,
+            "failed": self.failed,
+            "inline": self.inline,
+            "rejected": self.rejected,
+            "dropped": self.dropped,
+        }
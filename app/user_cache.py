@@ -0,0 +1,167 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.db import AsyncSessionLocal
+from app.models import User
+
+log = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class UserState:
+    id: int
+    gate_verified: bool
+    suspended: bool
+    is_banned: bool
+    username: Optional[str]
+    language: Optional[str]
+
+    @property
+    def can_participate(self) -> bool:
+        return self.gate_verified and not self.suspended and not self.is_banned
+
+    @classmethod
+    def from_user(cls, u: User) -> "UserState":
+        return cls(
+            id=u.id,
+            gate_verified=bool(u.gate_verified),
+            suspended=bool(u.suspended),
+            is_banned=bool(u.is_banned),
+            username=u.username,
+            language=u.language,
+        )
+
+
+class UserStateCache:
+    # حالة البوابة لكل مستخدم في ذاكرة العملية مع TTL؛ أي تغيير للحالة يمر عبر update/invalidate.
+    # تحديثات اليوزر واللغة لا تستحق commit فوري، فتُجمع وتُكتب دفعة واحدة
+    def __init__(self, ttl: float, maxsize: int, flush_ms: int):
+        self.ttl = ttl
+        self.maxsize = max(1, maxsize)
+        self.interval = max(flush_ms, 10) / 1000
+        self._data: OrderedDict[int, Tuple[UserState, float]] = OrderedDict()
+        self._profiles: Dict[int, Tuple[Optional[str], Optional[str]]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.misses = 0
+        self.profile_writes = 0
+
+    def get(self, user_id: int) -> Optional[UserState]:
+        item = self._data.get(user_id)
+        if item is None or item[1] <= time.monotonic():
+            if item is not None:
+                del self._data[user_id]
+            self.misses += 1
+            return None
+        self._data.move_to_end(user_id)
+        self.hits += 1
+        return item[0]
+
+    def put(self, state: UserState) -> UserState:
+        self._data[state.id] = (state, time.monotonic() + self.ttl)
+        self._data.move_to_end(state.id)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+        return state
+
+    def update(self, user_id: int, **fields: Any) -> None:
+        # write-through بعد commit المستدعي؛ إن لم يكن مخزنًا فلا شيء نحدّثه
+        item = self._data.get(user_id)
+        if item is not None:
+            self._data[user_id] = (replace(item[0], **fields), item[1])
+
+    def invalidate(self, user_id: int) -> None:
+        self._data.pop(user_id, None)
+
+    def invalidate_many(self, user_ids: Iterable[int]) -> None:
+        for uid in user_ids:
+            self._data.pop(uid, None)
+
+    def note_profile(self, state: UserState, username: Optional[str], language: Optional[str]) -> UserState:
+        if state.username == username and state.language == language:
+            return state
+        self._profiles[state.id] = (username, language)
+        self.update(state.id, username=username, language=language)
+        return replace(state, username=username, language=language)
+
+    async def flush(self) -> None:
+        pending, self._profiles = self._profiles, {}
+        if not pending:
+            return
+        rows = [{"id": uid, "username": un, "language": lang} for uid, (un, lang) in pending.items()]
+        try:
+            async with AsyncSessionLocal() as session:
+                await session.execute(update(User), rows)
+                await session.commit()
+            self.profile_writes += len(rows)
+        except Exception:
+            log.exception("Failed to write %s deferred user profile updates", len(rows))
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+            "pending_profiles": len(self._profiles),
+            "profile_writes": self.profile_writes,
+        }
+
+
+user_state_cache = UserStateCache(
+    ttl=settings.user_cache_ttl_seconds,
+    maxsize=settings.user_cache_size,
+    flush_ms=settings.user_profile_flush_ms,
+)
+
+
+async def load_user_state(session: AsyncSession, user_id: int) -> Optional[UserState]:
+    state = user_state_cache.get(user_id)
+    if state is not None:
+        return state
+    u = await session.get(User, user_id)
+    if not u:
+        return None
+    return user_state_cache.put(UserState.from_user(u))
+
+
+async def upsert_user(session: AsyncSession, tg_user) -> UserState:
+    state = await load_user_state(session, tg_user.id)
+    if state is not None:
+        return user_state_cache.note_profile(state, tg_user.username, tg_user.language_code)
+
+    await session.execute(
+        insert(User)
+        .values(id=tg_user.id, username=tg_user.username, language=tg_user.language_code)
+        .on_conflict_do_nothing()
+    )
+    await session.commit()
+    state = await load_user_state(session, tg_user.id)
+    return user_state_cache.note_profile(state, tg_user.username, tg_user.language_code)
@@ -1,30 +1,67 @@
 from __future__ import annotations
 
+import time
+from typing import Dict, Optional, Tuple
+
 from aiogram import Bot
-from aiogram.types import Message
+from aiogram.types import Chat, ChatMember, Message
 from aiogram.exceptions import TelegramBadRequest
-from typing import Optional, Tuple
 
+from app.config import settings
 
-def extract_forwarded_chat_id(msg: Message) -> Optional[int]:
+# صلاحيات البوت في كل جهة: my_chat_member يحدّثها فورًا في العامل الذي استلمه فقط،
+# فمدة الكاش قصيرة حتى لا يثق بقية العمال بصلاحيات سُحبت
+_bot_member_cache: Dict[int, Tuple[ChatMember, float]] = {}
+_chat_cache: Dict[str, Tuple[Chat, float]] = {}
+
+
+def extract_forwarded_chat(msg: Message) -> Optional[Chat]:
     try:
-        if msg.forward_origin and getattr(msg.forward_origin, "type", None) == "chat":
+        if msg.forward_origin and getattr(msg.forward_origin, "type", None) in ("chat", "channel"):
             chat = getattr(msg.forward_origin, "chat", None)
             if chat:
-                return chat.id
+                return chat
     except Exception:
         pass
 
     if msg.forward_from_chat:
-        return msg.forward_from_chat.id
+        return msg.forward_from_chat
 
     return None
 
 
+def extract_forwarded_chat_id(msg: Message) -> Optional[int]:
+    chat = extract_forwarded_chat(msg)
+    return chat.id if chat else None
+
+
+def remember_bot_member(chat_id: int, cm: ChatMember) -> None:
+    _bot_member_cache[chat_id] = (cm, time.monotonic() + settings.bot_admin_cache_seconds)
+
+
+async def get_bot_member(bot: Bot, chat_id: int) -> ChatMember:
+    # bot.id مأخوذ من التوكن فلا حاجة لـ get_me؛ الأخطاء لا تُخزَّن
+    cached = _bot_member_cache.get(chat_id)
+    if cached and cached[1] > time.monotonic():
+        return cached[0]
+    cm = await bot.get_chat_member(chat_id, bot.id)
+    remember_bot_member(chat_id, cm)
+    return cm
+
+
+async def resolve_chat(bot: Bot, ref: str) -> Chat:
+    key = ref.lower()
+    cached = _chat_cache.get(key)
+    if cached and cached[1] > time.monotonic():
+        return cached[0]
+    chat = await bot.get_chat(ref)
+    _chat_cache[key] = (chat, time.monotonic() + settings.chat_resolve_cache_seconds)
+    return chat
+
+
 async def ensure_bot_admin(bot: Bot, chat_id: int) -> Tuple[bool, str]:
     try:
-        me = await bot.get_me()
-        cm = await bot.get_chat_member(chat_id, me.id)
+        cm = await get_bot_member(bot, chat_id)
         if cm.status not in ("administrator", "creator"):
             return False, "يجب إضافة البوت مشرفًا في هذه الجهة."
         return True, ""
@@ -36,8 +73,7 @@ async def ensure_bot_admin(bot: Bot, chat_id: int) -> Tuple[bool, str]:
 
 async def ensure_bot_admin_with_member_mgmt(bot: Bot, chat_id: int) -> Tuple[bool, str]:
     try:
-        me = await bot.get_me()
-        cm = await bot.get_chat_member(chat_id, me.id)
+        cm = await get_bot_member(bot, chat_id)
         if cm.status == "creator":
             return True, ""
         if cm.status != "administrator":
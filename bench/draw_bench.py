@@ -0,0 +1,111 @@
+"""Draw benchmark: bounded memory and uniformity of iter_random_entries.
+
+Runs against DATABASE_URL (Postgres) with the app's usual env:
+
+    python -m bench.draw_bench --entries 1000000
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import time
+import tracemalloc
+from collections import Counter
+
+from sqlalchemy import delete, text
+
+from app.db import engine, Base, AsyncSessionLocal
+from app.draw import iter_random_entries
+from app.models import Giveaway, Entry
+
+
+async def make_giveaway(session, n: int, exclude_every: int) -> int:
+    g = Giveaway(creator_user_id=0, target_chat_id=0, target_chat_type="bench", template_text="bench", winners_count=1)
+    session.add(g)
+    await session.flush()
+    await session.execute(
+        text(
+            "INSERT INTO entries (giveaway_id, user_id, username, seq_no, excluded) "
+            "SELECT :g, s, NULL, s, (s % :ex = 0) FROM generate_series(1, :n) AS s"
+        ),
+        {"g": g.id, "n": n, "ex": exclude_every},
+    )
+    await session.commit()
+    return g.id
+
+
+async def drop_giveaway(session, gid: int) -> None:
+    await session.execute(delete(Entry).where(Entry.giveaway_id == gid))
+    await session.execute(delete(Giveaway).where(Giveaway.id == gid))
+    await session.commit()
+
+
+async def take(session, gid: int, k: int) -> list:
+    out = []
+    async for r in iter_random_entries(session, gid):
+        out.append(r)
+        if len(out) >= k:
+            break
+    return out
+
+
+async def bench_memory(sizes: list[int], k: int, exclude_every: int) -> None:
+    print(f"memory: k={k}, every {exclude_every}th entry excluded")
+    for n in sizes:
+        async with AsyncSessionLocal() as session:
+            gid = await make_giveaway(session, n, exclude_every)
+            tracemalloc.start()
+            t0 = time.perf_counter()
+            winners = await take(session, gid, k)
+            elapsed = time.perf_counter() - t0
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            assert all(r.seq_no % exclude_every for r in winners), "excluded entry drawn"
+            print(f"  entries={n:>9}  winners={len(winners):>3}  peak={peak / 1024:8.1f} KiB  time={elapsed * 1000:7.1f} ms")
+            await drop_giveaway(session, gid)
+
+
+async def bench_uniformity(n: int, k: int, draws: int, exclude_every: int) -> None:
+    async with AsyncSessionLocal() as session:
+        gid = await make_giveaway(session, n, exclude_every)
+        counts: Counter = Counter()
+        for _ in range(draws):
+            for r in await take(session, gid, k):
+                counts[r.seq_no] += 1
+        await drop_giveaway(session, gid)
+
+    eligible = [s for s in range(1, n + 1) if s % exclude_every]
+    assert set(counts) <= set(eligible), "excluded entry drawn"
+    expected = draws * k / len(eligible)
+    chi2 = sum((counts[s] - expected) ** 2 / expected for s in eligible)
+    dof = len(eligible) - 1
+    # تقريب Wilson–Hilferty لحد 99.9% لتوزيع كاي تربيع
+    z = 3.09
+    limit = dof * (1 - 2 / (9 * dof) + z * (2 / (9 * dof)) ** 0.5) ** 3
+    verdict = "OK" if chi2 < limit else "NOT UNIFORM"
+    print(f"uniformity: entries={n} eligible={len(eligible)} k={k} draws={draws}")
+    print(f"  min={min(counts[s] for s in eligible)} max={max(counts[s] for s in eligible)} expected={expected:.1f}")
+    print(f"  chi2={chi2:.1f} dof={dof} limit(99.9%)={limit:.1f} -> {verdict}")
+
+
+async def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--entries", type=int, default=1_000_000)
+    ap.add_argument("--winners", type=int, default=100)
+    ap.add_argument("--exclude-every", type=int, default=10)
+    ap.add_argument("--uniform-entries", type=int, default=50)
+    ap.add_argument("--uniform-winners", type=int, default=3)
+    ap.add_argument("--draws", type=int, default=5000)
+    args = ap.parse_args()
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    sizes = sorted({min(10_000, args.entries), min(100_000, args.entries), args.entries})
+    await bench_memory(sizes, args.winners, args.exclude_every)
+    await bench_uniformity(args.uniform_entries, args.uniform_winners, args.draws, args.exclude_every)
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())